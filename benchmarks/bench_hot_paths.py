@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+主脚本纯 CPU 热点路径的微基准测试
+覆盖验证码预处理、识别文本的纠正/解析策略（recognize_and_calculate 下载图片之后的部分）、calculate_operation、
+订单列表解析（1~5000 个订单的合成页面）、客户资料表单提取和 main() 的汇总报告生成。
+
+用法:
+    python benchmarks/bench_hot_paths.py [--filter parse_servers] [--save baseline.json] [--compare baseline.json]
+
+--save 把结果写成基线 JSON；--compare 与之前保存的基线对比（按每次调用的最小耗时），
+变慢超过 --threshold 的用例会标出并以非 0 退出码结束。
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+
+from common import ROOT_DIR, euser_renew, make_captcha, make_customer_page, make_orders_page, make_results
+
+ORDER_COUNTS = [1, 10, 100, 1000, 5000]
+
+# 识别文本 → 覆盖的解析策略
+CAPTCHA_TEXTS = {
+    'alnum': 'AB3DE9',     # 情况1：6 位字母数字
+    'standard': '7+3',     # 策略1：标准 3 位
+    'corrected': 'ZT5',    # 策略1：字符纠正（Z→2，T→+）
+    'regex': '12x3',       # 策略2：多位数正则
+    'aggressive': 'S5Z',   # 策略3：激进纠正后推断运算符
+    'cleanup': '4?+2',     # 策略4：清理无法识别的字符
+    'failed': '??',        # 全部策略失败
+}
+
+
+def build_cases():
+    """返回 [(用例名, 无参函数)]"""
+    cases = []
+
+    captcha = make_captcha('7+3')
+    cases.append(('preprocess_captcha', lambda: euser_renew.preprocess_captcha(captcha)))
+    for name, text in CAPTCHA_TEXTS.items():
+        cases.append((f'parse_captcha_text[{name}]', lambda text=text: euser_renew.parse_captcha_text(text)))
+    cases.append(('rank_captcha_answers[standard]', lambda: euser_renew.rank_captcha_answers('7+3')))
+    cases.append(('calculate_operation', lambda: [euser_renew.calculate_operation(12, op, 3, '', silent=True)
+                                                  for op in ('+', '-', '×', '/', '?')]))
+
+    for count in ORDER_COUNTS:
+        page = make_orders_page(count)
+        cases.append((f'parse_servers[{count}]', lambda page=page: euser_renew.parse_servers(page)))
+
+    customer_page = make_customer_page()
+    cases.append(('extract_customer_form', lambda: euser_renew.extract_customer_form(customer_page)))
+
+    for accounts in (10, 100):
+        results = make_results(accounts)
+        cases.append((f'build_report[{accounts}]', lambda results=results: euser_renew.build_report(results)))
+    return cases
+
+
+def measure(fn, repeat: int, min_time: float):
+    """自动确定循环次数使单轮耗时不少于 min_time，重复 repeat 轮，返回每次调用的 (中位数, 最小值) 秒数和循环次数"""
+    timer = timeit.Timer(fn)
+    loops = 1
+    while timer.timeit(loops) < min_time:
+        loops *= 2 if loops < 1000 else 10
+    times = [t / loops for t in timer.repeat(repeat, loops)]
+    return statistics.median(times), min(times), loops
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主脚本热点路径微基准测试")
+    parser.add_argument('--filter', default='', help="只运行名称包含该字符串的用例")
+    parser.add_argument('--repeat', type=int, default=5, help="每个用例重复轮数")
+    parser.add_argument('--min-time', type=float, default=0.1, help="单轮最短耗时（秒）")
+    parser.add_argument('--save', help="把结果写入基线 JSON 文件")
+    parser.add_argument('--compare', help="与基线 JSON 文件对比")
+    parser.add_argument('--threshold', type=float, default=0.10, help="对比时判定为变慢的比例")
+    args = parser.parse_args()
+
+    euser_renew.logger.setLevel('CRITICAL')  # 只测量计算本身，不把日志写出计入耗时
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+    regressions = []
+    print(f"{'用例':<34}{'中位数':>12}{'最小值':>12}{'循环':>8}{'对比基线':>12}")
+    for name, fn in build_cases():
+        if args.filter not in name:
+            continue
+        median, best, loops = measure(fn, args.repeat, args.min_time)
+        results[name] = {'median': median, 'min': best, 'loops': loops}
+
+        change = ''
+        if name in baseline:
+            ratio = best / baseline[name]['min'] - 1  # 最小值受系统噪声影响最小，用于对比
+            change = f"{ratio:+.1%}"
+            if ratio > args.threshold:
+                change += ' ⚠️'
+                regressions.append(name)
+        print(f"{name:<34}{format_time(median):>12}{format_time(best):>12}{loops:>8}{change:>12}")
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {
+                    'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'commit': git_commit(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'repeat': args.repeat,
+                    'min_time': args.min_time
+                },
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {args.save}")
+
+    if regressions:
+        print(f"变慢超过 {args.threshold:.0%} 的用例: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
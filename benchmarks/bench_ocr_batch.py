@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+验证码批量推理基准测试
+用 N 个线程同时提交验证码，比较不同 max_batch 下的吞吐量和单张延迟
+
+用法: python benchmarks/bench_ocr_batch.py [--images 64] [--threads 8] [--batch-sizes 1,2,4,8,16]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import euser_renew, make_captcha, random_expression
+
+
+def run(service, images, threads):
+    """返回 (总耗时秒, 每张延迟毫秒列表)"""
+    def classify(image_bytes):
+        started = time.perf_counter()
+        service.classify(image_bytes)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(classify, images))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="验证码批量推理基准测试")
+    parser.add_argument('--images', type=int, default=64, help="识别图片数")
+    parser.add_argument('--threads', type=int, default=8, help="同时提交的线程数")
+    parser.add_argument('--batch-sizes', default='1,2,4,8,16', help="要比较的 max_batch，逗号分隔")
+    parser.add_argument('--window-ms', type=float, default=5, help="攒批窗口（毫秒）")
+    parser.add_argument('--intra-op-threads', type=int, default=0)
+    parser.add_argument('--inter-op-threads', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    images = [make_captcha(random_expression(rng), seed=i) for i in range(args.images)]
+
+    print(f"{'模式':<12}{'吞吐(张/秒)':>12}{'p50(ms)':>10}{'p95(ms)':>10}")
+
+    def report(name, elapsed, latencies):
+        p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+        print(f"{name:<12}{len(latencies) / elapsed:>12.1f}{statistics.median(latencies):>10.1f}{p95:>10.1f}")
+
+    # 基线：原来的加锁逐张识别
+    class Sequential:
+        def __init__(self):
+            self.ocr = euser_renew.get_ocr()  # get_ocr() 自己会拿 ocr_lock，必须在进入锁之前调用
+
+        def classify(self, image_bytes):
+            with euser_renew.ocr_lock:
+                return self.ocr.classification(image_bytes, png_fix=True)
+
+    run(Sequential(), images[:4], 1)  # 预热
+    report('逐张+锁', *run(Sequential(), images, args.threads))
+
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        service = euser_renew.OcrService(
+            batch_window_ms=args.window_ms,
+            max_batch=batch_size,
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads
+        )
+        if service.session is None:
+            print("未能创建批量推理会话（需要安装 onnx），跳过批量测试")
+            return
+        run(service, images[:4], 1)  # 预热
+        report(f'batch={batch_size}', *run(service, images, args.threads))
+
+
+if __name__ == '__main__':
+    main()
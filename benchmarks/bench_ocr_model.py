@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+验证码模型对比基准测试
+比较默认 ddddocr beta 模型与自定义/量化模型的模型大小、加载时间、单张推理延迟和准确率
+
+用法:
+    python benchmarks/bench_ocr_model.py --model models/euserv_captcha.onnx [--model models/euserv_captcha.int8.onnx]
+        [--samples /path/to/samples]
+
+--samples 指定 tools/train_captcha_model.py 生成过 labels.jsonl 的样本目录；不指定时使用合成验证码。
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from common import euser_renew, make_captcha, random_expression
+
+
+def load_labeled(sample_dir: str):
+    """读取 labels.jsonl，返回 [(原图字节, 标签)]"""
+    items = []
+    with open(os.path.join(sample_dir, 'labels.jsonl'), 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            with open(os.path.join(sample_dir, record['file']), 'rb') as image_file:
+                items.append((image_file.read(), record['label']))
+    return items
+
+
+def expected_answer(label: str) -> str:
+    """标签对应的验证码答案：运算式计算结果，字母数字验证码为大写原文"""
+    return euser_renew.parse_captcha_text(label)
+
+
+def bench(name, model_path, charsets_path, items):
+    started = time.perf_counter()
+    model = euser_renew.load_ocr(model_path, charsets_path)
+    load_ms = (time.perf_counter() - started) * 1000
+    size_kb = os.path.getsize(model._DdddOcr__graph_path) / 1024
+
+    processed = [euser_renew.preprocess_captcha(image_bytes) for image_bytes, _ in items]
+    model.classification(processed[0], png_fix=True)  # 预热
+
+    latencies, text_correct, answer_correct = [], 0, 0
+    for image_bytes, (_, label) in zip(processed, items):
+        started = time.perf_counter()
+        text = model.classification(image_bytes, png_fix=True).strip()
+        latencies.append((time.perf_counter() - started) * 1000)
+        text_correct += text.replace(' ', '') == label
+        answer_correct += euser_renew.parse_captcha_text(text) == expected_answer(label)
+
+    p95 = sorted(latencies)[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<28}{size_kb:>10.0f}{load_ms:>10.0f}{statistics.mean(latencies):>10.2f}{p95:>10.2f}"
+          f"{text_correct / len(items):>10.1%}{answer_correct / len(items):>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="验证码模型对比基准测试")
+    parser.add_argument('--model', action='append', default=[], help="自定义 ONNX 模型路径，可重复指定")
+    parser.add_argument('--samples', help="带 labels.jsonl 的样本目录")
+    parser.add_argument('--count', type=int, default=200, help="未指定样本目录时生成的合成验证码数")
+    args = parser.parse_args()
+
+    euser_renew.logger.setLevel('ERROR')
+    if args.samples:
+        items = load_labeled(args.samples)
+    else:
+        rng = random.Random(0)
+        items = []
+        for i in range(args.count):
+            label = random_expression(rng)
+            items.append((make_captcha(label, seed=i), label))
+
+    print(f"样本数: {len(items)}")
+    print(f"{'模型':<28}{'大小(KB)':>10}{'加载(ms)':>10}{'平均(ms)':>10}{'p95(ms)':>10}{'文本准确':>10}{'答案准确':>10}")
+    bench('ddddocr beta（默认）', '', '', items)
+    for model_path in args.model:
+        bench(os.path.basename(model_path), model_path, '', items)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试公共工具：导入主脚本，生成合成验证码、订单列表页、客户资料页和处理结果
+"""
+
+import io
+import os
+import random
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import euser_renew  # noqa: E402
+
+
+def make_captcha(text: str, seed: int = 0, size=(200, 70)) -> bytes:
+    """生成与 EUserv 验证码风格相近的图片：白底橙字，加灰色干扰线和噪点"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        points = [(rng.randint(0, size[0]), rng.randint(0, size[1])) for _ in range(2)]
+        draw.line(points, fill=(rng.randint(120, 200),) * 3, width=2)
+    try:
+        font = ImageFont.truetype("DejaVuSans-Bold.ttf", 36)
+    except OSError:
+        font = ImageFont.load_default()
+    draw.text((30 + rng.randint(-5, 5), 15 + rng.randint(-5, 5)), text, fill=(240, 150, 30), font=font)
+    for _ in range(300):
+        draw.point((rng.randrange(size[0]), rng.randrange(size[1])), fill=(rng.randint(0, 255),) * 3)
+    output = io.BytesIO()
+    img.save(output, format='PNG')
+    return output.getvalue()
+
+
+def random_expression(rng: random.Random) -> str:
+    """随机运算验证码文本，如 7+3"""
+    return f"{rng.randint(1, 9)}{rng.choice('+-x')}{rng.randint(1, 9)}"
+
+
+def make_orders_page(count: int, seed: int = 0) -> str:
+    """生成包含 count 个订单的合成订单列表页（结构与 EUserv 客户订单表一致，约一半订单暂不可续期）"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.5:
+            action = f"Contract extension possible from {2026 + rng.randint(0, 1)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        else:
+            action = '<input type="submit" value="Extend contract">'
+        rows.append(
+            f'<tr><td class="td-z1-sp1-kc">{1000000 + i}</td><td>vServer</td>'
+            f'<td class="td-z1-sp2-kc"><div class="kc2_order_action_container">{action}</div></td></tr>'
+        )
+    return (
+        '<html><body><a href="?logout=1">logout</a> customer'
+        '<div id="kc2_order_customer_orders_tab_content_1">'
+        '<table class="kc2_order_table kc2_content_table"><tr><th>Order</th></tr>'
+        + ''.join(rows) +
+        '</table></div></body></html>'
+    )
+
+
+def make_customer_page() -> str:
+    """生成合成的客户资料页（c_* 输入框、下拉框、[] 数组字段，以及页面上的其它表单）"""
+    countries = ''.join(f'<option value="{code}"{" selected" if code == "DE" else ""}>{code}</option>'
+                        for code in ['AT', 'CH', 'CN', 'DE', 'FR', 'GB', 'NL', 'US'] * 25)
+    inputs = ''.join(f'<input type="text" name="c_{name}" value="{name} value">'
+                     for name in ['street', 'streetno', 'postal', 'city', 'phone_country_prefix', 'phone_password',
+                                  'fax_country_prefix', 'tac_date', 'website', 'emailabo_contract',
+                                  'emailabo_products', 'forumnick', 'hrno', 'hrcourt', 'taxid', 'identifier',
+                                  'birthplace'])
+    arrays = ''.join(f'<input type="text" name="c_{name}[]" value=" {i} ">'
+                     for name in ['birthday', 'phone', 'fax', 'ustid'] for i in range(3))
+    return (
+        '<html><body><form action="/search"><input name="q" value=""><input type="submit" value="Go"></form>'
+        '<form method="post"><input type="hidden" name="c_id" value="123456">'
+        '<select id="c_att" name="c_att"><option value="1">Mr</option><option value="2" selected>Ms</option></select>'
+        f'<select id="c_country" name="c_country">{countries}</select>'
+        f'<select id="c_country_of_birth" name="c_country_of_birth">{countries}</select>'
+        '<select id="c_firstcontact" name="c_firstcontact"><option value="9" selected>web</option></select>'
+        f'{inputs}{arrays}<input type="submit" name="c_submit" value="Save"></form></body></html>'
+    )
+
+
+def make_results(accounts: int, orders_per_account: int = 3) -> list:
+    """生成 main() 汇总报告用的合成处理结果：成功续期、无需续期、失败的账号各占一部分"""
+    results = []
+    for i in range(accounts):
+        servers = {str(1000000 + i * 10 + j): (False, '2026-12-01') for j in range(orders_per_account)}
+        result = {'email': f'user{i}@example.com', 'success': i % 5 != 4, 'servers': servers,
+                  'renew_results': [], 'error': None if i % 5 != 4 else '登录失败'}
+        if i % 2 == 0:
+            result['renew_results'] = [{'order_id': order_id, 'success': True,
+                                        'message': f"✅ 服务器 {order_id} 续期成功，下次可续期日期 2027-01-01"}
+                                       for order_id in servers]
+        results.append(result)
+    return results
@@ -8,16 +8,38 @@ EUserv 自动续期脚本 - 多账号多线程版本
 import os
 
 import sys
+import argparse
 import io
 import re
 import json
 import time
+import heapq
+import queue
+import socket
+import sqlite3
+import uuid
+import hashlib
+import importlib
+import signal
+import socketserver
+import http.client
 import threading
 import logging
+import atexit
+import contextvars
+import cProfile
+import pstats
+import linecache
+import tracemalloc
 from typing import Dict, List, Tuple, Optional
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
+from contextlib import closing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import onnxruntime
 from PIL import Image
 import ddddocr
 import requests
@@ -25,43 +47,169 @@ from bs4 import BeautifulSoup
 from imap_tools import MailBox, AND
 from urllib.parse import quote
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(threadName)s] %(levelname)s: %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+try:
+    import onnx  # 可选：用于验证码批量推理
+except ImportError:
+    onnx = None
+
+# ============== 日志 ==============
+# 各线程只把日志记录放入队列，由 QueueListener 后台线程统一写控制台/文件，避免工作线程阻塞在日志 I/O 上。
+LOG_FORMAT = '%(asctime)s [%(threadName)s] %(levelname)s: %(message)s'
+LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
+
+# 当前处理的账号，随流水线任务在线程间传递，用于按账号拆分日志
+log_account = contextvars.ContextVar('log_account', default='')
+
+
+class AccountLogFilter(logging.Filter):
+    """在产生日志的线程中给记录打上当前账号（record.account）"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.account = log_account.get()
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """每条日志输出一行 JSON，便于按账号、级别检索"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            'time': self.formatTime(record, LOG_DATEFMT),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'account': getattr(record, 'account', ''),
+            'message': record.getMessage()
+        }, ensure_ascii=False)
+
+
+class AccountFileHandler(logging.Handler):
+    """按账号写入 log_dir/<账号>.log（按大小轮转），不属于任何账号的日志写入 log_dir/euserv.log"""
+
+    def __init__(self, log_dir: str, max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.handlers: Dict[str, logging.Handler] = {}
+        os.makedirs(log_dir, exist_ok=True)
+
+    def emit(self, record: logging.LogRecord):
+        account = getattr(record, 'account', '') or 'euserv'
+        handler = self.handlers.get(account)
+        if handler is None:
+            file_name = re.sub(r'[^\w.@-]', '_', account) + '.log'
+            handler = RotatingFileHandler(os.path.join(self.log_dir, file_name), maxBytes=self.max_bytes,
+                                          backupCount=self.backup_count, encoding='utf-8')
+            handler.setFormatter(self.formatter)
+            self.handlers[account] = handler
+        handler.handle(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        super().close()
+
+
+def setup_logging(log_dir: str = "", log_format: str = "text") -> QueueListener:
+    """
+    配置非阻塞日志：根 logger 只挂 QueueHandler，控制台（及可选的按账号轮转文件）由后台监听线程写出
+    log_format 为 json 时每条日志输出一行 JSON
+    """
+    formatter = JsonLogFormatter() if log_format.lower() == 'json' else logging.Formatter(LOG_FORMAT, LOG_DATEFMT)
+    handlers = [logging.StreamHandler()]
+    if log_dir:
+        handlers.append(AccountFileHandler(log_dir))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(AccountLogFilter())
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers[:] = [queue_handler]
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+# 配置日志：LOG_DIR 启用按账号轮转的日志文件，LOG_FORMAT=json 输出结构化日志
+log_listener = setup_logging(os.getenv("LOG_DIR", ""), os.getenv("LOG_FORMAT", "text"))
 logger = logging.getLogger(__name__)
 
 # 兼容新版 Pillow
 if not hasattr(Image, 'ANTIALIAS'):
     Image.ANTIALIAS = Image.Resampling.LANCZOS
 
-# 全局 OCR 实例（线程安全）
-ocr = ddddocr.DdddOcr(beta=True)
+
+def load_ocr(model_path: str = "", charsets_path: str = "") -> ddddocr.DdddOcr:
+    """
+    加载 OCR 模型：默认使用 ddddocr 通用 beta 模型；
+    指定 model_path 时加载自训练/量化的 ONNX 模型，字符集默认取同名 .json 文件
+    """
+    if model_path:
+        logger.info(f"使用自定义验证码模型: {model_path}")
+        return ddddocr.DdddOcr(show_ad=False, import_onnx_path=model_path,
+                               charsets_path=charsets_path or os.path.splitext(model_path)[0] + '.json')
+    return ddddocr.DdddOcr(beta=True)
+
+
+# 全局 OCR 实例（线程安全，首次使用时加载），OCR_MODEL_PATH 可指定 tools/train_captcha_model.py 导出的 EUserv 专用模型
+_ocr = None
 ocr_lock = threading.Lock()
 
+
+def get_ocr() -> ddddocr.DdddOcr:
+    """获取全局 OCR 实例；使用验证码识别服务的运行实例不会加载模型"""
+    global _ocr
+    with ocr_lock:
+        if _ocr is None:
+            _ocr = load_ocr(os.getenv("OCR_MODEL_PATH", ""), os.getenv("OCR_CHARSETS_PATH", ""))
+        return _ocr
+
+
+# 流水线阶段
+STAGE_HTTP = 'http'  # 网络请求 + 页面解析
+STAGE_OCR = 'ocr'    # 验证码识别（CPU 密集）
+
 USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.61 Safari/537.36"
 
 
 # ============== 配置数据类 ==============
 class AccountConfig:
     """单个账号配置"""
-    def __init__(self, email, password, imap_server='imap.gmail.com', email_password=''):
+    def __init__(self, email, password, imap_server='imap.gmail.com', email_password='', imap_user=''):
         self.email = email
         self.password = password
         self.imap_server = imap_server
         self.email_password = email_password if email_password else password
+        self.imap_user = imap_user if imap_user else email  # 收取 PIN 邮件的邮箱账号，多个 EUserv 账号可共用同一收件箱
 
 
 class GlobalConfig:
     """全局配置"""
-    def __init__(self, telegram_bot_token="", telegram_chat_id="", bark_url="", max_workers=3, max_login_retries=3):
+    def __init__(self, telegram_bot_token="", telegram_chat_id="", bark_url="", max_workers=3, max_login_retries=3,
+                 run_time_budget=0, pipeline=True, stage_workers=None, max_in_flight=10,
+                 ocr_batch_window_ms=5, ocr_max_batch=8, ocr_intra_op_threads=0, ocr_inter_op_threads=0,
+                 mail_poll_interval=3, pin_timeout=90, lease_ttl=300):
         self.telegram_bot_token = telegram_bot_token
         self.telegram_chat_id = telegram_chat_id
         self.bark_url = bark_url  # 新增：Bark 推送 URL
         self.max_workers = max_workers
         self.max_login_retries = max_login_retries
+        self.run_time_budget = run_time_budget  # 单次运行时间预算（秒），0 表示不限制
+        self.pipeline = pipeline  # 是否使用分阶段流水线执行（False 时每个账号占用一个线程，线程数为 max_workers）
+        self.stage_workers = stage_workers or {STAGE_HTTP: 4, STAGE_OCR: 4}  # 流水线各阶段工作线程数
+        self.max_in_flight = max_in_flight  # 流水线同时处理的账号数
+        self.ocr_batch_window_ms = ocr_batch_window_ms  # 验证码批量识别的攒批窗口（毫秒）
+        self.ocr_max_batch = ocr_max_batch  # 单批最多识别的验证码数
+        self.ocr_intra_op_threads = ocr_intra_op_threads  # onnxruntime 算子内线程数，0 为默认
+        self.ocr_inter_op_threads = ocr_inter_op_threads  # onnxruntime 算子间线程数，0 为默认
+        self.mail_poll_interval = mail_poll_interval  # 等待 PIN 邮件时的邮箱轮询间隔（秒）
+        self.pin_timeout = pin_timeout  # 等待 PIN 邮件的最长时间（秒）
+        self.lease_ttl = lease_ttl  # 账号租约有效期（秒），运行实例异常退出后租约在此时间后过期
 
 
 # ============== 配置区 ==============
@@ -71,9 +219,38 @@ GLOBAL_CONFIG = GlobalConfig(
     telegram_chat_id=os.getenv("TG_CHAT_ID"), # tg的userid
     bark_url=os.getenv("BARK_URL"),  #ios系统bark推送,基础格式：https://api.day.app/your_key/，或自建服务器：https://your-bark-server.com/your_key/
     max_workers=3,
-    max_login_retries=5
+    max_login_retries=5,
+    run_time_budget=int(os.getenv("RUN_TIME_BUDGET") or 0),  # 运行时间预算（秒），超时后未开始的账号/订单将被跳过
+    pipeline=os.getenv("PIPELINE", "1") != "0",  # 设置 PIPELINE=0 退回每账号一个线程的模式
+    stage_workers={STAGE_HTTP: 4, STAGE_OCR: 4},  # 流水线各阶段线程数：网络请求 / 验证码识别（PIN 邮件由每个邮箱的监听线程读取）
+    max_in_flight=10,
+    ocr_batch_window_ms=5,  # 多个账号同时遇到验证码时，5 毫秒内的请求合并为一次批量推理
+    ocr_max_batch=8,
+    ocr_intra_op_threads=int(os.getenv("OCR_INTRA_OP_THREADS") or 0),
+    ocr_inter_op_threads=int(os.getenv("OCR_INTER_OP_THREADS") or 0),
+    mail_poll_interval=3,
+    pin_timeout=90,
+    lease_ttl=300
 )
 
+# 验证码样本目录：设置后保存每次识别的验证码及是否通过，供 tools/train_captcha_model.py 训练专用模型
+CAPTCHA_SAMPLE_DIR = os.getenv("CAPTCHA_SAMPLE_DIR", "")
+captcha_sample_lock = threading.Lock()
+
+# 验证码识别服务地址：unix:/path/to.sock 或 host:port，由 captcha-server 命令启动；未设置时在本进程内识别
+CAPTCHA_SERVICE = os.getenv("CAPTCHA_SERVICE", "")
+
+# 状态文件：记录上次运行获取到的各订单可续期日期，用于下次按紧急度调度
+STATE_FILE = os.getenv("EUSERV_STATE_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "euserv_state.json")
+
+# 会话缓存：保存登录后的会话，status 命令优先复用，缓存有效时无需重新登录
+SESSION_FILE = os.getenv("EUSERV_SESSION_FILE") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "euserv_sessions.json")
+session_file_lock = threading.Lock()
+
+# 账号租约：多个运行实例同时运行时，同一账号只由一个实例处理
+LEASE_BACKEND = os.getenv("LEASE_BACKEND", "")  # 空为本机 SQLite，none 为不使用，或 模块:工厂函数 接入共享存储
+LEASE_DB = os.getenv("LEASE_DB") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "euserv_leases.db")
+
 
 # 账号列表配置
 ACCOUNTS = [
@@ -95,175 +272,392 @@ ACCOUNTS = [
 # ====================================
 
 
-def recognize_and_calculate(captcha_image_url: str, session: requests.Session) -> Optional[str]:
-    """识别并计算验证码（线程安全）"""
-    
-    # 数字字符纠正映射表（用于操作数）
-    DIGIT_CORRECTIONS = {
-        'O': '0', 'o': '0',  # 字母O → 数字0
-        'D': '0', 'Q': '0',  # D/Q可能是0
-        'I': '1', 'i': '1', 'l': '1', '|': '1',  # I/l/竖线 → 数字1
-        'Z': '2', 'z': '2',  # 字母Z → 数字2
-        'S': '5', 's': '5',  # 字母S → 数字5
-        'G': '6', 'b': '6',  # 字母G → 数字6
-        'B': '8', 'g': '8',  # 字母B → 数字8
-    }
-    
-    # 运算符映射表（用于中间位置）
-    OPERATOR_CORRECTIONS = {
-        'T': '+', 't': '+', 'F': '+', 'f': '+', 'r': '+', # T → 加号
-        'I': '-', 'i': '-', '|': '-', '1': '-', 'l': '-',  # 竖线类 → 减号
-        'x': '×', 'X': '×',  # x/X → 乘号
-        '*': '×', '×': '×',  # 统一乘号
-        '÷': '/', ':': '/',  # 统一除号
-        '+': '+', '-': '-', '/': '/',  # 保留原有运算符
-    }
-    
-    def aggressive_digit_convert(text: str) -> str:
-        """激进的数字转换：尽可能把所有字符转为数字"""
-        result = []
-        for char in text:
-            if char.isdigit():
-                result.append(char)
-            elif char in DIGIT_CORRECTIONS:
-                result.append(DIGIT_CORRECTIONS[char])
-            elif char.upper() in DIGIT_CORRECTIONS:
-                result.append(DIGIT_CORRECTIONS[char.upper()])
+# ============== 验证码识别服务（批量推理） ==============
+class OcrService:
+    """
+    OCR 识别服务：把多个线程同时提交的验证码图片在 batch_window_ms 毫秒内攒成一批，
+    用一次 onnxruntime 批量推理完成识别。
+    需要 onnx 包把 ddddocr 模型的 batch 维改为动态；不可用时退回逐张调用 classification。
+    """
+
+    def __init__(self, batch_window_ms: float = 5, max_batch: int = 8,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0, model: ddddocr.DdddOcr = None):
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.model = model or get_ocr()
+        self.lock = ocr_lock if model is None else threading.Lock()
+        self.pending = queue.Queue()
+
+        self.session = self._create_batch_session()
+        if self.session is not None:
+            threading.Thread(target=self._batch_loop, name="ocr_batch", daemon=True).start()
+
+    def _create_batch_session(self):
+        """
+        加载 ddddocr 模型并把输入 batch 维改为动态，失败时返回 None。
+        预处理参数读取的是 ddddocr 的私有属性，ddddocr 升级导致读取失败时同样退回逐张识别。
+        """
+        if onnx is None:
+            logger.info("未安装 onnx，验证码逐张识别")
+            return None
+        try:
+            if self.model._DdddOcr__word:
+                # 单字模型输出格式不同，不做批量推理
+                return None
+
+            # 与 ddddocr.classification 一致的预处理参数：缩放尺寸、通道数、归一化均值/方差
+            self.charset = self.model._DdddOcr__charset
+            if self.model.use_import_onnx:
+                self.resize = self.model._DdddOcr__resize
+                self.channel = self.model._DdddOcr__channel
+                if self.channel == 1:
+                    self.mean, self.std = np.array([0.456]), np.array([0.224])
+                else:
+                    self.mean, self.std = np.array([0.485, 0.456, 0.406]), np.array([0.229, 0.224, 0.225])
             else:
-                # 字母无法转换，保留原样
-                result.append(char)
-        return ''.join(result)
-    
+                self.resize, self.channel = [-1, 64], 1
+                self.mean, self.std = np.array([0.5]), np.array([0.5])
+
+            model = onnx.load(self.model._DdddOcr__graph_path)
+            model.graph.input[0].type.tensor_type.shape.dim[0].dim_param = 'batch'
+            options = onnxruntime.SessionOptions()
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            if self.inter_op_threads:
+                options.inter_op_num_threads = self.inter_op_threads
+            return onnxruntime.InferenceSession(model.SerializeToString(), options, providers=['CPUExecutionProvider'])
+        except Exception as e:
+            logger.warning(f"⚠️ 创建批量推理会话失败，验证码逐张识别: {e}")
+            return None
+
+    def classify(self, image_bytes: bytes) -> str:
+        """识别一张验证码图片，返回原始识别文本（线程安全，阻塞到所在批次完成）"""
+        if self.session is None:
+            with self.lock:
+                return self.model.classification(image_bytes, png_fix=True)
+        future = Future()
+        self.pending.put((image_bytes, future))
+        return future.result()
+
+    def classify_batch(self, images: List[bytes]) -> List[str]:
+        """
+        对一批验证码图片做批量推理。
+        补白会改变 CRNN 的输出，因此按缩放后的宽度分组，每组宽度相同的图片做一次推理，结果与逐张识别一致。
+        """
+        arrays = [self._to_array(image_bytes) for image_bytes in images]
+        groups = {}
+        for i, array in enumerate(arrays):
+            groups.setdefault(array.shape[2], []).append(i)
+
+        results = [''] * len(arrays)
+        for indices in groups.values():
+            batch = np.stack([arrays[i] for i in indices]).astype(np.float32)
+            outputs = self.session.run(None, {'input1': batch})[0]
+            if self.model.use_import_onnx:
+                indexes = outputs  # 自定义模型直接输出 (batch, 序列长度) 的字符下标
+            else:
+                indexes = np.argmax(outputs, axis=2).T  # 官方模型输出 (序列长度, batch, 字符集)
+
+            for i, row in zip(indices, indexes):
+                # CTC 解码：合并连续重复字符并去掉空白符
+                chars, last_item = [], 0
+                for item in row:
+                    if item != last_item and item != 0:
+                        chars.append(self.charset[item])
+                    last_item = item
+                results[i] = ''.join(chars)
+        return results
+
+    def _to_array(self, image_bytes: bytes) -> np.ndarray:
+        """单张图片预处理，返回 (通道, 高, 宽) 的归一化数组"""
+        image = Image.open(io.BytesIO(image_bytes))
+        resize_width, resize_height = self.resize
+        if resize_width == -1:
+            image = image.resize((int(image.size[0] * (resize_height / image.size[1])), resize_height), Image.ANTIALIAS)
+        else:
+            image = image.resize((resize_width, resize_height), Image.ANTIALIAS)
+
+        if self.channel == 1:
+            array = np.array(image.convert('L')).astype(np.float32)[:, :, None]
+        else:
+            array = np.array(ddddocr.png_rgba_black_preprocess(image)).astype(np.float32)
+        array = (array / 255. - self.mean) / self.std
+        return array.transpose((2, 0, 1))
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.pending.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                texts = profile_call(self.classify_batch, [image_bytes for image_bytes, _ in batch], phase='ocr_batch')
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            logger.debug(f"批量识别 {len(batch)} 张验证码")
+            for (_, future), text in zip(batch, texts):
+                future.set_result(text)
+
+
+_ocr_service = None
+_ocr_service_lock = threading.Lock()
+
+
+def get_ocr_service() -> OcrService:
+    """获取全局 OCR 识别服务（首次调用时按全局配置创建）"""
+    global _ocr_service
+    with _ocr_service_lock:
+        if _ocr_service is None:
+            _ocr_service = OcrService(
+                batch_window_ms=GLOBAL_CONFIG.ocr_batch_window_ms,
+                max_batch=GLOBAL_CONFIG.ocr_max_batch,
+                intra_op_threads=GLOBAL_CONFIG.ocr_intra_op_threads,
+                inter_op_threads=GLOBAL_CONFIG.ocr_inter_op_threads
+            )
+        return _ocr_service
+
+
+def recognize_and_calculate(captcha_image_url: str, session: requests.Session) -> Optional[str]:
+    """下载、识别并计算验证码（线程安全）"""
     logger.info("正在处理验证码...")
     try:
-        logger.debug("尝试自动识别验证码...")
         response = session.get(captcha_image_url)
-        img = Image.open(io.BytesIO(response.content)).convert('RGB')
-        
-        # 颜色过滤（保留橙色文字，噪点变白）
-        pixels = img.load()
-        width, height = img.size
-        for x in range(width):
-            for y in range(height):
-                r, g, b = pixels[x, y]
-                if not (r > 200 and 100 < g < 220 and b < 80):
-                    pixels[x, y] = (255, 255, 255)
-        
-        # 转灰度 + 二值化
-        img = img.convert('L')
-        threshold = 200
-        img = img.point(lambda x: 0 if x < threshold else 255, '1')
-        
-        # 去边框
-        border = 10
-        pixels = img.load()
-        for x in range(width):
-            for y in range(height):
-                if x < border or x >= width - border or y < border or y >= height - border:
-                    pixels[x, y] = 255
-        
-        output = io.BytesIO()
-        img.save(output, format='PNG')
-        processed_bytes = output.getvalue()
-        
-        # OCR 识别（加锁保证线程安全）
-        with ocr_lock:
-            text = ocr.classification(processed_bytes, png_fix=True).strip()
-        
-        logger.debug(f"OCR 原始识别: {text}")
+    except Exception as e:
+        logger.error(f"验证码下载发生错误: {e}", exc_info=True)
+        return None
+    return solve_captcha(response.content)
+
+
+# 数字字符纠正映射表（用于操作数）
+DIGIT_CORRECTIONS = {
+    'O': '0', 'o': '0',  # 字母O → 数字0
+    'D': '0', 'Q': '0',  # D/Q可能是0
+    'I': '1', 'i': '1', 'l': '1', '|': '1',  # I/l/竖线 → 数字1
+    'Z': '2', 'z': '2',  # 字母Z → 数字2
+    'S': '5', 's': '5',  # 字母S → 数字5
+    'G': '6', 'b': '6',  # 字母G → 数字6
+    'B': '8', 'g': '8',  # 字母B → 数字8
+}
+
+# 运算符映射表（用于中间位置）
+OPERATOR_CORRECTIONS = {
+    'T': '+', 't': '+', 'F': '+', 'f': '+', 'r': '+', # T → 加号
+    'I': '-', 'i': '-', '|': '-', '1': '-', 'l': '-',  # 竖线类 → 减号
+    'x': '×', 'X': '×',  # x/X → 乘号
+    '*': '×', '×': '×',  # 统一乘号
+    '÷': '/', ':': '/',  # 统一除号
+    '+': '+', '-': '-', '/': '/',  # 保留原有运算符
+}
+
+
+def aggressive_digit_convert(text: str) -> str:
+    """激进的数字转换：尽可能把所有字符转为数字"""
+    result = []
+    for char in text:
+        if char.isdigit():
+            result.append(char)
+        elif char in DIGIT_CORRECTIONS:
+            result.append(DIGIT_CORRECTIONS[char])
+        elif char.upper() in DIGIT_CORRECTIONS:
+            result.append(DIGIT_CORRECTIONS[char.upper()])
+        else:
+            # 字母无法转换，保留原样
+            result.append(char)
+    return ''.join(result)
+
+
+def preprocess_captcha(image_bytes: bytes) -> bytes:
+    """验证码预处理：颜色过滤、二值化、去边框，返回 PNG 字节"""
+    img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+    # 颜色过滤（保留橙色文字，噪点变白）
+    pixels = img.load()
+    width, height = img.size
+    for x in range(width):
+        for y in range(height):
+            r, g, b = pixels[x, y]
+            if not (r > 200 and 100 < g < 220 and b < 80):
+                pixels[x, y] = (255, 255, 255)
+
+    # 转灰度 + 二值化
+    img = img.convert('L')
+    threshold = 200
+    img = img.point(lambda x: 0 if x < threshold else 255, '1')
+
+    # 去边框
+    border = 10
+    pixels = img.load()
+    for x in range(width):
+        for y in range(height):
+            if x < border or x >= width - border or y < border or y >= height - border:
+                pixels[x, y] = 255
+
+    output = io.BytesIO()
+    img.save(output, format='PNG')
+    return output.getvalue()
+
+
+def parse_captcha_text(text: str) -> str:
+    """把 OCR 识别文本解析为验证码答案（运算验证码返回计算结果）"""
+    # 预处理：去除空格
+    raw_text = text.strip().replace(' ', '')
+    text_len = len(raw_text)
+
+    logger.info(f"验证码长度: {text_len}, 内容: {raw_text}")
+
+    # ===== 情况1：长度 >= 6，按纯字母数字验证码处理 =====
+    if text_len >= 6:
+        logger.info(f"检测到 >= 6 位验证码，按纯字母数字处理: {raw_text}")
+        return raw_text.upper()  # 统一大写返回
+
+    # ===== 情况2：长度 < 6，按运算验证码处理 =====
+    logger.info(f"检测到 < 6 位验证码，按运算验证码处理: {raw_text}")
+
+    # 尝试多种解析策略
+    # 策略1：标准3位格式 (数字 运算符 数字)
+    if text_len == 3:
+        left_char, mid_char, right_char = raw_text[0], raw_text[1], raw_text[2]
+
+        # 左右转数字，中间转运算符
+        left_corrected = DIGIT_CORRECTIONS.get(left_char, left_char)
+        right_corrected = DIGIT_CORRECTIONS.get(right_char, right_char)
+        op_char = OPERATOR_CORRECTIONS.get(mid_char, mid_char)
+
+        logger.debug(f"3位纠正: '{left_char}'→'{left_corrected}' '{mid_char}'→'{op_char}' '{right_char}'→'{right_corrected}'")
+
+        if left_corrected.isdigit() and right_corrected.isdigit():
+            result = calculate_operation(int(left_corrected), op_char, int(right_corrected), raw_text)
+            if result is not None:
+                return result
 
-        # 预处理：去除空格
-        raw_text = text.strip().replace(' ', '')
-        text_len = len(raw_text)
-        
-        logger.info(f"验证码长度: {text_len}, 内容: {raw_text}")
-        
-        # ===== 情况1：长度 >= 6，按纯字母数字验证码处理 =====
-        if text_len >= 6:
-            logger.info(f"检测到 >= 6 位验证码，按纯字母数字处理: {raw_text}")
-            return raw_text.upper()  # 统一大写返回
-        
-        # ===== 情况2：长度 < 6，按运算验证码处理 =====
-        logger.info(f"检测到 < 6 位验证码，按运算验证码处理: {raw_text}")
-        
-        # 尝试多种解析策略
-        # 策略1：标准3位格式 (数字 运算符 数字)
-        if text_len == 3:
-            left_char, mid_char, right_char = raw_text[0], raw_text[1], raw_text[2]
-            
-            # 左右转数字，中间转运算符
-            left_corrected = DIGIT_CORRECTIONS.get(left_char, left_char)
-            right_corrected = DIGIT_CORRECTIONS.get(right_char, right_char)
-            op_char = OPERATOR_CORRECTIONS.get(mid_char, mid_char)
-            
-            logger.debug(f"3位纠正: '{left_char}'→'{left_corrected}' '{mid_char}'→'{op_char}' '{right_char}'→'{right_corrected}'")
-            
-            if left_corrected.isdigit() and right_corrected.isdigit():
-                result = calculate_operation(int(left_corrected), op_char, int(right_corrected), raw_text)
-                if result is not None:
+    # 策略2：正则匹配运算表达式（支持多位数）
+    # 先进行字符纠正
+    corrected_text = raw_text
+    for old, new in DIGIT_CORRECTIONS.items():
+        corrected_text = corrected_text.replace(old, new)
+
+    # 匹配模式：数字 + 运算符 + 数字
+    pattern = r'^(\d+)([+\-×*/÷:xX])(\d+)$'
+    match = re.match(pattern, corrected_text)
+
+    if match:
+        left_str, op, right_str = match.groups()
+        op = OPERATOR_CORRECTIONS.get(op, op)  # 运算符纠正
+
+        left = int(left_str)
+        right = int(right_str)
+
+        logger.debug(f"正则匹配成功: {left} {op} {right}")
+        result = calculate_operation(left, op, right, raw_text)
+        if result is not None:
+            return result
+
+    # 策略3：激进纠正 - 强制把所有非数字转为数字，再尝试解析
+    logger.warning(f"常规解析失败，尝试激进纠正...")
+    aggressive_text = aggressive_digit_convert(raw_text)
+    logger.debug(f"激进纠正结果: {raw_text} → {aggressive_text}")
+
+    # 如果纠正后全是数字，尝试按位置推断运算符
+    if aggressive_text.isdigit() and len(aggressive_text) >= 3:
+        # 假设：倒数第二位可能是被误识别的运算符
+        # 例如："253" 可能是 "2+3"（中间的5被误识别）
+        if len(aggressive_text) == 3:
+            left = int(aggressive_text[0])
+            right = int(aggressive_text[2])
+            # 尝试常见运算符
+            for op in ['+', '-', '×', '/']:
+                result = calculate_operation(left, op, right, raw_text, silent=True)
+                if result is not None and 0 <= int(result) <= 20:  # 结果在合理范围
+                    logger.info(f"激进推断成功: {left} {op} {right} = {result}")
                     return result
-        
-        # 策略2：正则匹配运算表达式（支持多位数）
-        # 先进行字符纠正
-        corrected_text = raw_text
-        for old, new in DIGIT_CORRECTIONS.items():
-            corrected_text = corrected_text.replace(old, new)
-        
-        # 匹配模式：数字 + 运算符 + 数字
-        pattern = r'^(\d+)([+\-×*/÷:xX])(\d+)$'
-        match = re.match(pattern, corrected_text)
-        
+
+    # 策略4：如果还有字母，再次尝试强制转换
+    if not aggressive_text.isdigit():
+        logger.warning(f"包含无法转换的字符: {aggressive_text}")
+        # 最后尝试：移除所有非数字非运算符字符
+        cleaned = re.sub(r'[^0-9+\-×*/÷]', '', corrected_text)
+        match = re.match(r'^(\d+)([+\-×*/÷])(\d+)$', cleaned)
         if match:
             left_str, op, right_str = match.groups()
-            op = OPERATOR_CORRECTIONS.get(op, op)  # 运算符纠正
-            
-            left = int(left_str)
-            right = int(right_str)
-            
-            logger.debug(f"正则匹配成功: {left} {op} {right}")
-            result = calculate_operation(left, op, right, raw_text)
+            result = calculate_operation(int(left_str), op, int(right_str), raw_text)
             if result is not None:
+                logger.info(f"清理后解析成功: {cleaned}")
                 return result
+
+    # 所有策略都失败，返回原始文本
+    logger.warning(f"所有解析策略均失败，返回原始文本: {raw_text}")
+    return raw_text
+
+
+def rank_captcha_answers(text: str) -> List[str]:
+    """
+    按可能性排序的验证码答案：parse_captcha_text 的结果排第一；
+    3 位运算验证码再附上按其它运算符计算的结果（运算符是最常见的误识别）
+    """
+    answers = [parse_captcha_text(text)]
+    raw_text = text.strip().replace(' ', '')
+    if len(raw_text) == 3:
+        left = DIGIT_CORRECTIONS.get(raw_text[0], raw_text[0])
+        right = DIGIT_CORRECTIONS.get(raw_text[2], raw_text[2])
+        if left.isdigit() and right.isdigit():
+            for op in ['+', '-', '×', '/']:
+                result = calculate_operation(int(left), op, int(right), raw_text, silent=True)
+                if result is not None and result not in answers:
+                    answers.append(result)
+    return answers
+
+
+def solve_captcha_local(image_bytes: bytes) -> List[str]:
+    """在本进程内识别验证码图片，返回排序后的答案，失败时返回空列表（纯 CPU 操作，线程安全）"""
+    try:
+        logger.debug("尝试自动识别验证码...")
+        processed_bytes = preprocess_captcha(image_bytes)
+
+        # OCR 识别（多个线程同时识别时合并为一次批量推理）
+        text = get_ocr_service().classify(processed_bytes).strip()
         
-        # 策略3：激进纠正 - 强制把所有非数字转为数字，再尝试解析
-        logger.warning(f"常规解析失败，尝试激进纠正...")
-        aggressive_text = aggressive_digit_convert(raw_text)
-        logger.debug(f"激进纠正结果: {raw_text} → {aggressive_text}")
-        
-        # 如果纠正后全是数字，尝试按位置推断运算符
-        if aggressive_text.isdigit() and len(aggressive_text) >= 3:
-            # 假设：倒数第二位可能是被误识别的运算符
-            # 例如："253" 可能是 "2+3"（中间的5被误识别）
-            if len(aggressive_text) == 3:
-                left = int(aggressive_text[0])
-                right = int(aggressive_text[2])
-                # 尝试常见运算符
-                for op in ['+', '-', '×', '/']:
-                    result = calculate_operation(left, op, right, raw_text, silent=True)
-                    if result is not None and 0 <= int(result) <= 20:  # 结果在合理范围
-                        logger.info(f"激进推断成功: {left} {op} {right} = {result}")
-                        return result
-        
-        # 策略4：如果还有字母，再次尝试强制转换
-        if not aggressive_text.isdigit():
-            logger.warning(f"包含无法转换的字符: {aggressive_text}")
-            # 最后尝试：移除所有非数字非运算符字符
-            cleaned = re.sub(r'[^0-9+\-×*/÷]', '', corrected_text)
-            match = re.match(r'^(\d+)([+\-×*/÷])(\d+)$', cleaned)
-            if match:
-                left_str, op, right_str = match.groups()
-                result = calculate_operation(int(left_str), op, int(right_str), raw_text)
-                if result is not None:
-                    logger.info(f"清理后解析成功: {cleaned}")
-                    return result
-        
-        # 所有策略都失败，返回原始文本
-        logger.warning(f"所有解析策略均失败，返回原始文本: {raw_text}")
-        return raw_text
-        
+        logger.debug(f"OCR 原始识别: {text}")
+        return rank_captcha_answers(text)
+
     except Exception as e:
         logger.error(f"验证码识别发生错误: {e}", exc_info=True)
-        return None
+        return []
+
+
+def solve_captcha(image_bytes: bytes) -> Optional[str]:
+    """识别并计算验证码图片：配置了验证码识别服务时优先交给服务，不可用时本地识别"""
+    client = get_captcha_client()
+    answers = client.solve(image_bytes) if client is not None else None
+    if answers is None:
+        answers = solve_captcha_local(image_bytes)
+    return answers[0] if answers else None
+
+
+def save_captcha_sample(image_bytes: bytes, answer: str, accepted: bool):
+    """保存验证码原图及提交结果到 CAPTCHA_SAMPLE_DIR（未配置时不保存）"""
+    if not CAPTCHA_SAMPLE_DIR:
+        return
+    try:
+        file_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{threading.get_ident()}.png"
+        with captcha_sample_lock:
+            os.makedirs(CAPTCHA_SAMPLE_DIR, exist_ok=True)
+            with open(os.path.join(CAPTCHA_SAMPLE_DIR, file_name), 'wb') as f:
+                f.write(image_bytes)
+            with open(os.path.join(CAPTCHA_SAMPLE_DIR, 'index.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'file': file_name, 'answer': answer, 'accepted': accepted}, ensure_ascii=False) + '\n')
+    except Exception as e:
+        logger.warning(f"⚠️ 保存验证码样本失败: {e}")
 
 
 def calculate_operation(left: int, op: str, right: int, raw_text: str, silent: bool = False) -> Optional[str]:
@@ -311,34 +705,953 @@ def calculate_operation(left: int, op: str, right: int, raw_text: str, silent: b
 
 
 
-def get_euserv_pin(email: str, email_password: str, imap_server: str) -> Optional[str]:
-    """从邮箱获取 EUserv PIN 码"""
+# ============== 验证码识别服务进程（sidecar） ==============
+# python euser_renew.py captcha-server 启动常驻的本地识别服务，模型只加载一次并保持预热；
+# 设置 CAPTCHA_SERVICE 后各运行实例把验证码原图发给该服务识别，服务不可用时自动退回本地识别。
+# 协议：POST /solve，请求体为验证码原图字节，返回 {"answers": [按可能性排序的答案]}；GET /health 用于探活。
+def parse_service_address(address: str) -> Tuple[str, str, int]:
+    """解析服务地址：unix:/path/to.sock 或 [http://]host:port，返回 (类型, 路径或主机, 端口)；格式错误时抛出 ValueError"""
+    if address.startswith('unix:'):
+        path = address[len('unix:'):]
+        if not path:
+            raise ValueError(f"无效的验证码识别服务地址（缺少 socket 路径）: {address}")
+        return 'unix', path, 0
+    host, _, port = address.replace('http://', '', 1).rstrip('/').rpartition(':')
+    if not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"无效的验证码识别服务地址（应为 unix:/path/to.sock 或 host:port）: {address}")
+    return 'tcp', host or '127.0.0.1', int(port)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """通过 Unix socket 通信的 HTTP 连接"""
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class CaptchaServiceClient:
+    """验证码识别服务客户端：请求失败后 RETRY_AFTER 秒内直接走本地识别，不再反复连接"""
+
+    RETRY_AFTER = 60
+
+    def __init__(self, address: str, timeout: float = 10):
+        self.address = parse_service_address(address)
+        self.timeout = timeout
+        self.unavailable_until = 0.0
+
+    def solve(self, image_bytes: bytes) -> Optional[List[str]]:
+        """返回服务给出的排序答案，服务不可用时返回 None"""
+        if time.monotonic() < self.unavailable_until:
+            return None
+        kind, host, port = self.address
+        if kind == 'unix':
+            connection = _UnixHTTPConnection(host, self.timeout)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        try:
+            connection.request('POST', '/solve', body=image_bytes, headers={'Content-Type': 'application/octet-stream'})
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}: {body[:200]!r}")
+            return json.loads(body)['answers']
+        except Exception as e:
+            logger.warning(f"⚠️ 验证码识别服务不可用，改为本地识别: {e}")
+            self.unavailable_until = time.monotonic() + self.RETRY_AFTER
+            return None
+        finally:
+            connection.close()
+
+
+_captcha_client = None
+_captcha_client_invalid = False  # CAPTCHA_SERVICE 格式错误，已退回本地识别
+_captcha_client_lock = threading.Lock()
+
+
+def get_captcha_client() -> Optional[CaptchaServiceClient]:
+    """获取验证码识别服务客户端，未配置 CAPTCHA_SERVICE 或地址格式错误时返回 None（在本进程内识别）"""
+    global _captcha_client, _captcha_client_invalid
+    if not CAPTCHA_SERVICE:
+        return None
+    with _captcha_client_lock:
+        if _captcha_client is None and not _captcha_client_invalid:
+            try:
+                _captcha_client = CaptchaServiceClient(CAPTCHA_SERVICE)
+            except ValueError as e:
+                logger.warning(f"⚠️ {e}，验证码改为本地识别")
+                _captcha_client_invalid = True
+        return _captcha_client
+
+
+class CaptchaRequestHandler(BaseHTTPRequestHandler):
+    """验证码识别服务的请求处理"""
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/solve':
+            self._send_json(404, {'error': 'not found'})
+            return
+        image_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not image_bytes:
+            self._send_json(400, {'error': 'empty body'})
+            return
+        self._send_json(200, {'answers': solve_captcha_local(image_bytes)})
+
+    def _send_json(self, status: int, data: Dict):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"验证码识别服务: {format % args}")
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听 Unix socket 的多线程 HTTP 服务"""
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)  # BaseHTTPRequestHandler 需要 (地址, 端口) 形式的客户端地址
+
+
+def serve_captcha(address: str):
+    """启动验证码识别服务（阻塞运行）：并发请求由 OcrService 合并为批量推理"""
+    get_ocr_service()  # 启动时加载模型
+    kind, host, port = parse_service_address(address)
+    if kind == 'unix':
+        if os.path.exists(host):
+            os.remove(host)  # 清理上次异常退出留下的 socket 文件
+        server = _UnixHTTPServer(host, CaptchaRequestHandler)
+        os.chmod(host, 0o660)
+    else:
+        server = ThreadingHTTPServer((host, port), CaptchaRequestHandler)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # systemd/docker 停止时也清理 socket 文件
+    logger.info(f"✅ 验证码识别服务已启动: {address}")
     try:
-        logger.info(f"正在从邮箱 {email} 获取 PIN 码...")
-        with MailBox(imap_server).login(email, email_password) as mailbox:
-            for msg in mailbox.fetch(AND(from_='no-reply@euserv.com', body='PIN'), limit=1, reverse=True):
-                logger.debug(f"找到邮件: {msg.subject}, 收件时间: {msg.date_str}")
-                
-                match = re.search(r'PIN:\s*\n?(\d{6})', msg.text)
-                if match:
-                    pin = match.group(1)
-                    logger.info(f"✅ 提取到 PIN 码: {pin}")
-                    return pin
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if kind == 'unix' and os.path.exists(host):
+            os.remove(host)
+
+
+# ============== 性能分析（--profile） ==============
+# 账号流程按阶段（登录、更新资料、获取列表、续期、校验）标记 profile_phase，标记随流水线任务在线程间传递；
+# 各驱动在执行步骤时按 (线程, 阶段) 启用 cProfile，结束时合并为一个 .prof，并记录各阶段墙钟时间与内存快照。
+# Python 3.12+ 同一进程只能启用一个 cProfile 且它会记录所有线程，因此改为全程一个全局 cProfile（merged.prof），
+# 各阶段的数据由采样线程按 sys._current_frames() 读取正在执行步骤的线程调用栈得到（<阶段>.folded）。
+profile_phase = contextvars.ContextVar('profile_phase', default='other')
+phase_started = contextvars.ContextVar('phase_started', default=None)
+
+
+class PhaseProfiler:
+    """按阶段收集 cProfile 数据（3.12+ 为调用栈采样）、墙钟时间和 tracemalloc 快照，运行结束时写入 output_dir/<时间>/"""
+
+    PER_THREAD_PROFILE = sys.version_info < (3, 12)  # 3.12+ 只能有一个全局 cProfile，各阶段改用采样
+    SAMPLE_INTERVAL = 0.005  # 采样间隔（秒）
+
+    # 内存对比时排除分析工具自身的分配
+    ALLOCATION_FILTERS = [
+        tracemalloc.Filter(False, cProfile.__file__, all_frames=True),
+        tracemalloc.Filter(False, pstats.__file__, all_frames=True),
+        tracemalloc.Filter(False, linecache.__file__, all_frames=True),
+        tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+        tracemalloc.Filter(False, '<unknown>')
+    ]
+
+    def __init__(self, output_dir: str):
+        self.output_dir = os.path.join(output_dir, datetime.now().strftime('%Y%m%d_%H%M%S'))
+        self.profiles = {}  # (线程 id, 阶段) -> cProfile.Profile
+        self.local = threading.local()
+        self.active = {}  # 线程 id -> 正在执行步骤的阶段（供采样线程读取）
+        self.samples = {}  # 阶段 -> {折叠调用栈: 采样次数}
+        self.wall = {}  # 阶段 -> [次数, 墙钟秒数]
+        self.memory = {}  # 阶段 -> 结束时的最大已分配内存（字节）
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        tracemalloc.start(10)
+        self.start_snapshot = tracemalloc.take_snapshot()
+
+        if not self.PER_THREAD_PROFILE:
+            self.global_profile = cProfile.Profile()
+            self.global_profile.enable()
+            self.stop_sampling = threading.Event()
+            self.sampler = threading.Thread(target=self._sample_loop, name="profile_sampler", daemon=True)
+            self.sampler.start()
+
+    def call(self, fn, *args, phase: Optional[str] = None):
+        """在当前阶段（或指定阶段）的 profile 下执行 fn；同一线程内已在分析时直接执行（cProfile 不支持嵌套）"""
+        if getattr(self.local, 'active', False):
+            return fn(*args)
+        phase = phase or profile_phase.get()
+        ident = threading.get_ident()
+        if not self.PER_THREAD_PROFILE:
+            self.active[ident] = phase
+            self.local.active = True
+            try:
+                return fn(*args)
+            finally:
+                del self.active[ident]
+                self.local.active = False
+
+        key = (ident, phase)
+        profile = self.profiles.get(key)
+        if profile is None:
+            profile = cProfile.Profile()
+            with self.lock:
+                self.profiles[key] = profile
+        profile.enable()
+        self.local.active = True
+        try:
+            return fn(*args)
+        finally:
+            profile.disable()
+            self.local.active = False
+
+    def _sample_loop(self):
+        """每隔 SAMPLE_INTERVAL 记录一次各线程正在执行的调用栈，计入该线程当前所在阶段"""
+        while not self.stop_sampling.wait(self.SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident, phase in list(self.active.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    counts = self.samples.setdefault(phase, {})
+                    folded = ';'.join(reversed(stack))
+                    counts[folded] = counts.get(folded, 0) + 1
+
+    def record_phase(self, phase: str, seconds: float):
+        with self.lock:
+            stats = self.wall.setdefault(phase, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            self.memory[phase] = max(self.memory.get(phase, 0), tracemalloc.get_traced_memory()[1])
+
+    def write(self):
+        """合并各线程的 profile 并写出：merged.prof、<阶段>.prof、memory_*.snapshot 和 summary.json"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        end_snapshot = tracemalloc.take_snapshot()  # 在汇总 profile 之前拍快照，避免计入 pstats 自身的分配
+
+        cpu = {}
+        if self.PER_THREAD_PROFILE:
+            by_phase = {}
+            with self.lock:
+                for (_, phase), profile in self.profiles.items():
+                    by_phase.setdefault(phase, []).append(profile)
+
+            merged = None
+            for phase, profiles in by_phase.items():
+                stats = pstats.Stats(*profiles)
+                stats.dump_stats(os.path.join(self.output_dir, f"{phase}.prof"))
+                cpu[phase] = round(stats.total_tt, 3)
+                if merged is None:
+                    merged = pstats.Stats(*profiles)
                 else:
-                    match_fallback = re.search(r'(\d{6})', msg.text)
-                    if match_fallback:
-                        pin = match_fallback.group(1)
-                        logger.warning(f"⚠️ 备选匹配 PIN 码: {pin}")
-                        return pin
-                    
-            logger.warning("❌ 未找到符合条件的 EUserv 邮件")
-            return None
+                    merged.add(*profiles)
+            if merged is not None:
+                merged.dump_stats(os.path.join(self.output_dir, 'merged.prof'))
+        else:
+            self.stop_sampling.set()
+            self.sampler.join()
+            self.global_profile.disable()
+            self.global_profile.dump_stats(os.path.join(self.output_dir, 'merged.prof'))
+            for phase, counts in self.samples.items():
+                # 折叠调用栈格式，可直接用 flamegraph.pl / speedscope 查看
+                with open(os.path.join(self.output_dir, f"{phase}.folded"), 'w', encoding='utf-8') as f:
+                    for folded, count in sorted(counts.items(), key=lambda item: -item[1]):
+                        f.write(f"{folded} {count}\n")
+                cpu[phase] = round(sum(counts.values()) * self.SAMPLE_INTERVAL, 3)
+
+        self.start_snapshot.dump(os.path.join(self.output_dir, 'memory_start.snapshot'))
+        end_snapshot.dump(os.path.join(self.output_dir, 'memory_end.snapshot'))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        summary = {
+            'total_seconds': round(time.monotonic() - self.started, 3),
+            'phase_profile': 'cprofile' if self.PER_THREAD_PROFILE else 'sampling',
+            'phases': {
+                phase: {
+                    'count': count,
+                    'wall_seconds': round(seconds, 3),
+                    'profiled_seconds': cpu.get(phase, 0),
+                    'peak_memory_kb': self.memory.get(phase, 0) // 1024
+                }
+                for phase, (count, seconds) in self.wall.items()
+            },
+            'other_profiled_seconds': {phase: seconds for phase, seconds in cpu.items() if phase not in self.wall},
+            'memory_kb': {'current': current // 1024, 'peak': peak // 1024},
+            'top_allocations': [
+                str(stat) for stat in end_snapshot.filter_traces(self.ALLOCATION_FILTERS).compare_to(
+                    self.start_snapshot.filter_traces(self.ALLOCATION_FILTERS), 'lineno')[:20]
+            ]
+        }
+        with open(os.path.join(self.output_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        logger.info(f"📊 性能分析结果已写入 {self.output_dir}（可用 snakeviz / pstats 查看 merged.prof）")
+
+
+_profiler: Optional[PhaseProfiler] = None
+
+
+def start_profiler(output_dir: str):
+    """启用性能分析（--profile）"""
+    global _profiler
+    _profiler = PhaseProfiler(output_dir)
+
+
+def stop_profiler():
+    """写出性能分析结果（未启用时不做任何事）"""
+    global _profiler
+    if _profiler is not None:
+        _profiler.write()
+        _profiler = None
+
+
+def profile_call(fn, *args, phase: Optional[str] = None):
+    """执行 fn(*args)，启用性能分析时计入当前阶段"""
+    if _profiler is None:
+        return fn(*args)
+    return _profiler.call(fn, *args, phase=phase)
+
+
+def enter_phase(phase: str):
+    """
+    在账号流程中标记进入新阶段，并把上一阶段的墙钟时间（含等待验证码、邮件、sleep 的时间）计入统计
+    phase 为 None 时只结束当前阶段
+    """
+    previous = profile_phase.get()
+    started = phase_started.get()
+    if _profiler is not None and started is not None:
+        _profiler.record_phase(previous, time.monotonic() - started)
+    if phase is None:
+        phase_started.set(None)
+    else:
+        profile_phase.set(phase)
+        phase_started.set(time.monotonic())
+
+# ============== 分阶段流水线 ==============
+# 账号流程（登录、验证码、PIN、获取列表、续期）写成步骤生成器：
+# 每一步 yield 一个 StageCall（在指定阶段执行的调用）、Wait（纯等待）或 Await（等待 Future），
+# 由 run_inline 顺序执行，或由 StagedPipeline 分发到各阶段的线程池执行。
+class StageCall:
+    """流水线步骤：在 stage 阶段的工作线程中执行 fn(*args, **kwargs)，结果 send 回生成器"""
+    __slots__ = ('stage', 'fn', 'args', 'kwargs')
+
+    def __init__(self, stage: str, fn, *args, **kwargs):
+        self.stage = stage
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self):
+        return self.fn(*self.args, **self.kwargs)
+
+
+class Wait:
+    """流水线等待步骤：等待期间不占用任何工作线程"""
+    __slots__ = ('seconds',)
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+
+class Await:
+    """流水线等待步骤：等待 Future 完成（如邮箱监听器返回的 PIN），结果 send 回生成器，期间不占用任何工作线程"""
+    __slots__ = ('future',)
+
+    def __init__(self, future: Future):
+        self.future = future
+
 
+class Parallel:
+    """流水线并行步骤：同时执行多个 StageCall，全部完成后按顺序以列表 send 回生成器，任一失败则抛出第一个异常"""
+    __slots__ = ('calls',)
+
+    MAX_CALLS = 4  # 单个并行步骤最多包含的调用数（决定流水线队列容量）
+
+    def __init__(self, *calls: StageCall):
+        assert len(calls) <= self.MAX_CALLS
+        self.calls = calls
+
+
+def run_inline(steps):
+    """在当前线程中顺序执行步骤生成器，返回生成器的返回值"""
+    value, error = None, None
+    while True:
+        try:
+            request = profile_call(steps.throw, error) if error is not None else profile_call(steps.send, value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        if isinstance(request, Wait):
+            time.sleep(request.seconds)
+            continue
+        if isinstance(request, Await):
+            try:
+                value = request.future.result()
+            except Exception as e:
+                error = e
+            continue
+        if isinstance(request, Parallel):
+            with ThreadPoolExecutor(max_workers=len(request.calls)) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, profile_call, call) for call in request.calls]
+            try:
+                value = [future.result() for future in futures]
+            except Exception as e:
+                error = e
+            continue
+        try:
+            value = profile_call(request)
+        except Exception as e:
+            error = e
+
+
+class _ParallelGroup:
+    """收集一个 Parallel 步骤中各调用的结果"""
+    __slots__ = ('results', 'error', 'remaining', 'lock')
+
+    def __init__(self, size: int):
+        self.results = [None] * size
+        self.error = None
+        self.remaining = size
+        self.lock = threading.Lock()
+
+
+class _PipelineJob:
+    """流水线中的一个任务（一个账号的步骤生成器及其上下文变量，如日志中的当前账号）"""
+    __slots__ = ('steps', 'future', 'context')
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.future = Future()
+        self.context = contextvars.copy_context()
+
+
+class StagedPipeline:
+    """
+    分阶段流水线执行器
+    每个阶段拥有独立的有界队列和工作线程，账号按步骤在阶段间流转；
+    Wait 步骤由单独的定时线程负责唤醒，Await 步骤在 Future 完成时由回调唤醒，等待邮件的账号不占用工作线程。
+    同时处理的账号数受 max_in_flight 限制，每个账号同一时刻最多只有 Parallel.MAX_CALLS 个待执行调用，
+    因此各阶段队列容量取 max_in_flight * Parallel.MAX_CALLS 即不会因阶段间互相等待而死锁。
+    """
+
+    def __init__(self, stage_workers: Dict[str, int], max_in_flight: int = 10):
+        self.stage_workers = stage_workers
+        self.slots = threading.Semaphore(max_in_flight)
+        self.queues = {stage: queue.Queue(maxsize=max_in_flight * Parallel.MAX_CALLS) for stage in stage_workers}
+        self.stats = {stage: [0, 0.0] for stage in stage_workers}  # 阶段 -> [步骤数, 忙碌秒数]
+        self.stats_lock = threading.Lock()
+        self.timers = []  # (到期时间, 序号, 任务)
+        self.timer_seq = 0
+        self.timer_cond = threading.Condition()
+        self.running = True
+        self.threads = []
+        for stage, workers in stage_workers.items():
+            for i in range(workers):
+                thread = threading.Thread(target=self._worker, args=(stage,), name=f"{stage}_{i}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        self.timer_thread = threading.Thread(target=self._timer, name="wait", daemon=True)
+        self.timer_thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """提交一个步骤生成器函数，达到 max_in_flight 时阻塞直到有账号完成"""
+        self.slots.acquire()
+        job = _PipelineJob(fn(*args, **kwargs))
+        self._advance(job)
+        return job.future
+
+    def _advance(self, job: _PipelineJob, value=None, error: Optional[BaseException] = None):
+        """把上一步的结果交给生成器，并分发它产生的下一步"""
+        try:
+            if error is not None:
+                request = job.context.run(profile_call, job.steps.throw, error)
+            else:
+                request = job.context.run(profile_call, job.steps.send, value)
+        except StopIteration as stop:
+            self._finish(job, result=stop.value)
+            return
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+
+        if isinstance(request, Wait):
+            with self.timer_cond:
+                self.timer_seq += 1
+                heapq.heappush(self.timers, (time.monotonic() + request.seconds, self.timer_seq, job))
+                self.timer_cond.notify()
+        elif isinstance(request, Await):
+            request.future.add_done_callback(lambda future: self._advance_future(job, future))
+        elif isinstance(request, Parallel):
+            group = _ParallelGroup(len(request.calls))
+            for index, call in enumerate(request.calls):
+                self.queues[call.stage].put((job, call, group, index))
+        else:
+            self.queues[request.stage].put((job, request, None, 0))
+
+    def _advance_future(self, job: _PipelineJob, future: Future):
+        try:
+            value = future.result()
+        except Exception as e:
+            self._advance(job, error=e)
+            return
+        self._advance(job, value)
+
+    def _finish(self, job: _PipelineJob, result=None, error: Optional[BaseException] = None):
+        self.slots.release()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def _worker(self, stage: str):
+        stage_queue = self.queues[stage]
+        while True:
+            item = stage_queue.get()
+            if item is None:
+                return
+            job, request, group, index = item
+            value, error = None, None
+            started = time.monotonic()
+            try:
+                value = job.context.copy().run(profile_call, request)
+            except Exception as e:
+                error = e
+            elapsed = time.monotonic() - started
+            with self.stats_lock:
+                self.stats[stage][0] += 1
+                self.stats[stage][1] += elapsed
+
+            if group is None:
+                self._advance(job, value, error)
+                continue
+            with group.lock:
+                group.results[index] = value
+                if error is not None and group.error is None:
+                    group.error = error
+                group.remaining -= 1
+                done = group.remaining == 0
+            if done:
+                self._advance(job, group.results, group.error)
+
+    def _timer(self):
+        while True:
+            with self.timer_cond:
+                while self.running and (not self.timers or self.timers[0][0] > time.monotonic()):
+                    timeout = self.timers[0][0] - time.monotonic() if self.timers else None
+                    self.timer_cond.wait(timeout)
+                if not self.running:
+                    return
+                _, _, job = heapq.heappop(self.timers)
+            self._advance(job)
+
+    def shutdown(self):
+        """停止所有工作线程并输出各阶段耗时统计"""
+        with self.timer_cond:
+            self.running = False
+            self.timer_cond.notify()
+        for stage, workers in self.stage_workers.items():
+            for _ in range(workers):
+                self.queues[stage].put(None)
+        for thread in self.threads + [self.timer_thread]:
+            thread.join()
+        for stage, (count, busy) in self.stats.items():
+            logger.info(f"流水线阶段 {stage}: {count} 个步骤，忙碌 {busy:.1f} 秒，工作线程 {self.stage_workers[stage]} 个")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+
+# ============== 邮箱 PIN 监听 ==============
+def extract_pin(text: str) -> Optional[str]:
+    """从 EUserv 邮件正文提取 6 位 PIN 码"""
+    match = re.search(r'PIN:\s*\n?(\d{6})', text)
+    if match:
+        return match.group(1)
+    match_fallback = re.search(r'(\d{6})', text)
+    if match_fallback:
+        logger.warning(f"⚠️ 备选匹配 PIN 码: {match_fallback.group(1)}")
+        return match_fallback.group(1)
+    return None
+
+
+class PinRequest:
+    """等待 PIN 邮件的请求：只接收发给 recipient 且不早于 since 的邮件"""
+    __slots__ = ('recipient', 'since', 'deadline', 'future')
+
+    def __init__(self, recipient: str, since: datetime, timeout: float):
+        self.recipient = recipient
+        self.since = since
+        self.deadline = time.monotonic() + timeout
+        self.future = Future()
+
+
+class MailboxWatcher:
+    """
+    单个邮箱的 PIN 邮件监听器
+    独占一个 IMAP 连接，有等待中的请求时定时轮询新邮件，
+    按收件人和到达顺序（UID）把 EUserv PIN 邮件分发给最早登记的匹配请求，每封邮件只使用一次。
+    """
+
+    CLOCK_SKEW = timedelta(minutes=2)  # 邮件时间与本机时间允许的偏差
+    IDLE_LOGOUT = 60  # 无请求超过该秒数后断开 IMAP 连接
+
+    def __init__(self, imap_server: str, user: str, password: str, poll_interval: float = 3):
+        self.imap_server = imap_server
+        self.user = user
+        self.password = password
+        self.poll_interval = poll_interval
+        self.mailbox = None
+        self.pending: List[PinRequest] = []
+        self.recipients = set()
+        self.mails = {}  # uid -> (日期, 收件人集合, PIN)，已解析的 PIN 邮件
+        self.consumed = set()  # 已分发的邮件 uid
+        self.stale_before: Dict[str, datetime] = {}  # 收件人 -> 请求超时的时间，早于该时间的邮件属于已放弃的请求，不再分发
+        self.cond = threading.Condition()
+        self.closed = False
+        self.thread = None
+
+    def request_pin(self, recipient: str, since: datetime, timeout: float) -> Future:
+        """登记一个 PIN 请求，返回的 Future 在收到匹配邮件时得到 PIN，超时得到 None"""
+        request = PinRequest(recipient.lower(), since, timeout)
+        with self.cond:
+            self.pending.append(request)
+            self.recipients.add(request.recipient)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"imap_{self.user}", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return request.future
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                idle_started = time.monotonic()
+                while not self.pending and not self.closed:
+                    if self.mailbox is not None and time.monotonic() - idle_started >= self.IDLE_LOGOUT:
+                        self._logout()
+                    self.cond.wait(self.IDLE_LOGOUT)
+                if self.closed:
+                    pending, self.pending = self.pending, []
+                    break
+
+            profile_call(self._poll, phase='mail')
+            self._dispatch()
+
+            with self.cond:
+                if self.pending and not self.closed:
+                    self.cond.wait(self.poll_interval)
+
+        for request in pending:
+            request.future.set_result(None)
+        self._logout()
+
+    def _poll(self):
+        """拉取新的 EUserv PIN 邮件（只下载未解析过的 uid）"""
+        try:
+            if self.mailbox is None:
+                logger.info(f"正在连接邮箱 {self.user}...")
+                self.mailbox = MailBox(self.imap_server).login(self.user, self.password)
+            criteria = AND(from_='no-reply@euserv.com', body='PIN', date_gte=date.today() - timedelta(days=1))
+            new_uids = [uid for uid in self.mailbox.uids(criteria) if uid not in self.mails]
+            if not new_uids:
+                return
+            for msg in self.mailbox.fetch(AND(uid=new_uids), mark_seen=False):
+                logger.debug(f"找到邮件: {msg.subject}, 收件时间: {msg.date_str}")
+                mail_date = msg.date if msg.date.tzinfo else msg.date.replace(tzinfo=timezone.utc)
+                recipients = {address.lower() for address in msg.to + msg.cc}
+                self.mails[msg.uid] = (mail_date, recipients, extract_pin(msg.text))
+        except Exception as e:
+            logger.error(f"读取邮箱 {self.user} 时发生错误: {e}", exc_info=True)
+            self._logout()
+
+    def _dispatch(self):
+        """按到达顺序把邮件分发给请求，并让超时的请求返回 None（在锁外设置结果，避免回调中再次登记请求时阻塞）"""
+        resolved = []
+        with self.cond:
+            for uid in sorted(self.mails, key=int):
+                mail_date, recipients, pin = self.mails[uid]
+                if uid in self.consumed or not pin:
+                    continue
+                for request in self.pending:
+                    # 邮箱只服务一个收件人时不校验收件人（兼容转发等改写收件人的情况）
+                    recipient_ok = request.recipient in recipients or len(self.recipients) == 1
+                    # 时间偏差窗口内可能有上一次超时请求迟到的邮件，超时之前的邮件不分发，避免重试时提交过期的 PIN
+                    stale_before = self.stale_before.get(request.recipient)
+                    date_ok = mail_date >= request.since - self.CLOCK_SKEW and (stale_before is None or mail_date >= stale_before)
+                    if recipient_ok and date_ok:
+                        logger.info(f"✅ 提取到 {request.recipient} 的 PIN 码: {pin}")
+                        self.consumed.add(uid)
+                        self.pending.remove(request)
+                        resolved.append((request, pin))
+                        break
+
+            now = time.monotonic()
+            for request in [request for request in self.pending if request.deadline <= now]:
+                logger.warning(f"❌ 未找到发给 {request.recipient} 的 EUserv PIN 邮件")
+                self.pending.remove(request)
+                resolved.append((request, None))
+                if not any(other.recipient == request.recipient for other in self.pending):
+                    self.stale_before[request.recipient] = datetime.now(timezone.utc)
+
+        for request, pin in resolved:
+            request.future.set_result(pin)
+
+    def _logout(self):
+        if self.mailbox is None:
+            return
+        try:
+            self.mailbox.logout()
+        except Exception:
+            pass
+        self.mailbox = None
+
+
+class MailHub:
+    """按 (IMAP 服务器, 登录用户) 复用 MailboxWatcher：共用收件箱的多个账号只占用一个 IMAP 连接"""
+
+    def __init__(self, poll_interval: float = 3, pin_timeout: float = 90):
+        self.poll_interval = poll_interval
+        self.pin_timeout = pin_timeout
+        self.watchers: Dict[Tuple[str, str], MailboxWatcher] = {}
+        self.lock = threading.Lock()
+
+    def request_pin(self, account_config: AccountConfig, since: datetime) -> Future:
+        """为账号登记 PIN 请求，返回 Future（结果为 PIN 或 None）"""
+        logger.info(f"正在从邮箱 {account_config.imap_user} 获取 {account_config.email} 的 PIN 码...")
+        key = (account_config.imap_server, account_config.imap_user.lower())
+        with self.lock:
+            watcher = self.watchers.get(key)
+            if watcher is None:
+                watcher = MailboxWatcher(account_config.imap_server, account_config.imap_user,
+                                         account_config.email_password, self.poll_interval)
+                self.watchers[key] = watcher
+        return watcher.request_pin(account_config.email, since, self.pin_timeout)
+
+    def close(self):
+        """断开所有 IMAP 连接"""
+        with self.lock:
+            watchers = list(self.watchers.values())
+            self.watchers.clear()
+        for watcher in watchers:
+            watcher.close()
+
+
+_mail_hub = None
+_mail_hub_lock = threading.Lock()
+
+
+def get_mail_hub() -> MailHub:
+    """获取全局邮箱监听中心（首次调用时按全局配置创建）"""
+    global _mail_hub
+    with _mail_hub_lock:
+        if _mail_hub is None:
+            _mail_hub = MailHub(GLOBAL_CONFIG.mail_poll_interval, GLOBAL_CONFIG.pin_timeout)
+        return _mail_hub
+
+
+def fetch_quietly(session: requests.Session, url: str, **kwargs) -> Optional[requests.Response]:
+    """用于预取/非关键请求的 GET：失败时只记录日志并返回 None"""
+    try:
+        return session.get(url, **kwargs)
     except Exception as e:
-        logger.error(f"获取 PIN 码时发生错误: {e}", exc_info=True)
+        logger.debug(f"非关键请求失败 {url}: {e}")
         return None
 
 
+# 登录后落地页出现以下提示时，说明 EUserv 要求确认客户资料
+CUSTOMER_DATA_PENDING_MARKER = 'confirm or change your customer data here'
+
+
+def customer_data_pending(html: Optional[str]) -> bool:
+    """根据已获取的页面判断是否需要确认客户资料"""
+    return bool(html) and CUSTOMER_DATA_PENDING_MARKER in html.lower()
+
+
+def extract_customer_form(html: str) -> Dict:
+    """
+    一次遍历提取客户资料表单中的所有 c_* 字段，找不到该表单时返回空字典
+    只读取提交 kc2_customer_data_update（或包含 c_id）的表单，页面上其它表单（如修改密码）的字段不会被提交；
+    与浏览器一致跳过 disabled 的控件。
+    input 取 value（复选框/单选框只取选中的），select 取选中项（无选中项取第一项），
+    名称以 [] 结尾的字段按出现顺序收集为列表
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    forms = soup.find_all('form')
+    form = next((form for form in forms if form.find('input', attrs={'value': 'kc2_customer_data_update'})), None) \
+        or next((form for form in forms if form.find('input', attrs={'name': 'c_id'})), None)
+    if form is None:
+        return {}
+
+    fields = {}
+    for element in form.find_all(['input', 'select', 'textarea']):
+        name = element.get('name', '')
+        if not name.startswith('c_') or element.has_attr('disabled'):
+            continue
+        if element.name == 'select':
+            option = element.find('option', selected=True) or element.find('option')
+            value = option.get('value', option.get_text()) if option else ''
+        elif element.name == 'textarea':
+            value = element.get_text()
+        else:
+            input_type = element.get('type', 'text').lower()
+            if input_type in ('submit', 'button', 'image', 'reset'):
+                continue
+            if input_type in ('checkbox', 'radio') and not element.has_attr('checked'):
+                continue
+            value = element.get('value', '')
+
+        if name.endswith('[]'):
+            fields.setdefault(name, []).append(value.strip())
+        else:
+            fields[name] = value
+    return fields
+
+
+class LoginFailure:
+    """登录失败原因"""
+    BAD_CREDENTIALS = 'bad_credentials'  # 用户名或密码错误
+    NO_SESS_ID = 'no_sess_id'            # 首页中没有 sess_id（页面结构变化或被拦截）
+    IPLOCK = 'iplock'                    # 密码错误次数过多，IP 被临时锁定
+    CAPTCHA = 'captcha'                  # 验证码识别失败或错误次数过多
+    PIN = 'pin'                          # 未收到 PIN 邮件
+    PIN_REQUIRED = 'pin_required'        # 需要 PIN 验证但调用方不允许（只读模式）
+    TRANSIENT = 'transient'              # 网络异常等临时错误
+    UNKNOWN = 'unknown'                  # 无法识别的登录结果页
+
+    MESSAGES = {
+        BAD_CREDENTIALS: "用户名或密码错误",
+        NO_SESS_ID: "无法获取 sess_id",
+        IPLOCK: "IP 被临时锁定",
+        CAPTCHA: "验证码识别失败",
+        PIN: "未获取到 PIN 码",
+        PIN_REQUIRED: "需要 PIN 验证",
+        TRANSIENT: "网络异常",
+        UNKNOWN: "未知原因",
+    }
+
+
+class LoginResult:
+    """登录结果：布尔值表示是否登录成功；失败时 reason 为 LoginFailure 中的原因，retry_after 为 IP 锁定的剩余秒数"""
+    __slots__ = ('reason', 'retry_after')
+
+    def __init__(self, reason: Optional[str] = None, retry_after: float = 0):
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def __bool__(self) -> bool:
+        return self.reason is None
+
+    def __repr__(self) -> str:
+        return f"LoginResult({self.reason!r}, retry_after={self.retry_after})"
+
+
+# 登录失败后的重试策略：原因 → (是否重试, 重试前等待秒数)，等待秒数为 None 时等待 IP 锁定倒计时结束
+# PIN 邮件超时后不立即重登：给迟到的邮件留出时间到达，由邮箱监听器标记为过期，不会被下一次登录使用
+LOGIN_RETRY_POLICY = {
+    LoginFailure.BAD_CREDENTIALS: (False, 0),
+    LoginFailure.NO_SESS_ID: (False, 0),
+    LoginFailure.PIN_REQUIRED: (False, 0),
+    LoginFailure.IPLOCK: (True, None),
+    LoginFailure.CAPTCHA: (True, 0),
+    LoginFailure.PIN: (True, 30),
+    LoginFailure.TRANSIENT: (True, 0),
+    LoginFailure.UNKNOWN: (True, 5),
+}
+
+IPLOCK_DEFAULT_SECONDS = 300  # 页面上找不到倒计时时按 5 分钟处理
+
+
+def parse_iplock_countdown(html: str) -> int:
+    """从登录结果页读取 IP 锁定倒计时（kc2_login_iplock_cdown，格式为秒数或 分:秒），返回剩余秒数"""
+    soup = BeautifulSoup(html, 'html.parser')
+    element = soup.find(id='kc2_login_iplock_cdown') or soup.find(class_='kc2_login_iplock_cdown')
+    text = element.get_text(' ', strip=True) if element else ''
+    match = re.search(r'(\d+):(\d{2})', text)
+    if match:
+        return int(match.group(1)) * 60 + int(match.group(2))
+    match = re.search(r'\d+', text)
+    if match:
+        return int(match.group(0))
+    return IPLOCK_DEFAULT_SECONDS
+
+
+def is_logged_in_page(html: str) -> bool:
+    """页面是否为已登录状态（登录成功页或会话有效时的主页）"""
+    return any([
+        'Hello' in html,
+        'Confirm or change your customer data here' in html,
+        'logout' in html.lower() and 'customer' in html.lower()
+    ])
+
+
+def parse_servers(html: str) -> Dict[str, Tuple[bool, str]]:
+    """从订单列表页解析 {订单号: (是否可续期, 可续期日期)}"""
+    soup = BeautifulSoup(html, 'html.parser')
+    servers = {}
+
+    selector = '#kc2_order_customer_orders_tab_content_1 .kc2_order_table.kc2_content_table tr, #kc2_order_customer_orders_tab_content_2 .kc2_order_table.kc2_content_table tr'
+    for tr in soup.select(selector):
+        server_id = tr.select('.td-z1-sp1-kc')
+        if len(server_id) != 1:
+            continue
+        
+        action_containers = tr.select('.td-z1-sp2-kc .kc2_order_action_container')
+        if not action_containers:
+            continue
+            
+        action_text = action_containers[0].get_text()
+        logger.debug(f"续期信息: {action_text}")
+
+        can_renew = action_text.find("Contract extension possible from") == -1
+        can_renew_date = ""
+        
+        if not can_renew:
+            date_pattern = r'\b\d{4}-\d{2}-\d{2}\b'
+            match = re.search(date_pattern, action_text)
+            if match:
+                can_renew_date = match.group(0)
+                can_renew = datetime.today().date() >= datetime.strptime(can_renew_date, "%Y-%m-%d").date()
+
+        server_id_text = server_id[0].get_text().strip()
+        servers[server_id_text] = (can_renew, can_renew_date)
+    return servers
+
+
 class EUserv:
     """EUserv 操作类"""
     
@@ -347,9 +1660,23 @@ class EUserv:
         self.session = requests.Session()
         self.sess_id = None
         self.c_id = None
+        self.landing_page = None  # 登录成功后的落地页，用于判断是否需要确认客户资料
+        self.session_valid = False  # 最近一次获取的订单页是否为已登录状态
+        self.login_round_trips = 0  # 登录累计串行网络往返次数
+        self.login_round_trips_saved = 0  # 登录累计因并行/预取节省的往返次数
         
-    def login(self) -> bool:
+    def login(self, allow_pin: bool = True) -> LoginResult:
         """登录 EUserv（支持验证码和 PIN）"""
+        return run_inline(self.login_steps(allow_pin))
+
+    def restore_session(self, cached_session: Dict):
+        """恢复 save_session 缓存的会话"""
+        self.sess_id = cached_session['sess_id']
+        for cookie in cached_session.get('cookies', []):
+            self.session.cookies.set(**cookie)
+
+    def login_steps(self, allow_pin: bool = True):
+        """登录流程步骤生成器，返回 LoginResult；allow_pin=False 时遇到 PIN 验证直接返回失败（不触发读取邮件）"""
         logger.info(f"正在登录账号: {self.config.email}")
         
         headers = {
@@ -358,24 +1685,25 @@ class EUserv:
         }
         url = "https://support.euserv.com/index.iphp"
         captcha_url = "https://support.euserv.com/securimage_show.php"
+        round_trips, round_trips_saved = 0, 0
+        since = datetime.now(timezone.utc)  # 只接受本次登录之后到达的 PIN 邮件
         
         try:
             # 获取 sess_id
-            sess = self.session.get(url, headers=headers)
+            sess = yield StageCall(STAGE_HTTP, self.session.get, url, headers=headers)
+            round_trips += 1
             sess_id_match = re.search(r'sess_id["\']?\s*[:=]\s*["\']?([a-zA-Z0-9]{30,100})["\']?', sess.text)
             if not sess_id_match:
                 sess_id_match = re.search(r'sess_id=([a-zA-Z0-9]{30,100})', sess.text)
             
             if not sess_id_match:
                 logger.error("❌ 无法获取 sess_id")
-                return False
+                return LoginResult(LoginFailure.NO_SESS_ID)
             
             sess_id = sess_id_match.group(1)
             logger.debug(f"获取到 sess_id: {sess_id[:20]}...")
             
-            # 访问 logo
             logo_png_url = "https://support.euserv.com/pic/logo_small.png"
-            self.session.get(logo_png_url, headers=headers)
             
             # 提交登录表单
             login_data = {
@@ -387,8 +1715,18 @@ class EUserv:
                 'sess_id': sess_id
             }
             
+            # 提交登录表单的同时：
+            # - 访问 logo（仅模拟浏览器行为，不再单独占用一次往返）
+            # - 预取验证码图片。securimage 在生成图片时把答案存入会话，提交登录表单不会改变它；
+            #   不需要验证码时丢弃，预取的答案被拒绝时按正常流程重新获取
             logger.debug("提交登录表单...")
-            response = self.session.post(url, headers=headers, data=login_data)
+            response, captcha_response, _ = yield Parallel(
+                StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=login_data),
+                StageCall(STAGE_HTTP, fetch_quietly, self.session, captcha_url),
+                StageCall(STAGE_HTTP, fetch_quietly, self.session, logo_png_url, headers=headers),
+            )
+            round_trips += 1
+            round_trips_saved += 1  # logo
             response.raise_for_status()
 
             #解析返回页面
@@ -397,10 +1735,11 @@ class EUserv:
             # 检查登录错误
             if 'Please check email address/customer ID and password' in response.text:
                 logger.error("❌ 用户名或密码错误")
-                return False
+                return LoginResult(LoginFailure.BAD_CREDENTIALS)
             if 'kc2_login_iplock_cdown' in response.text:
-                logger.error("❌ 密码错误次数过多，账号被锁定，请5分钟后重试")
-                return False
+                countdown = parse_iplock_countdown(response.text)
+                logger.error(f"❌ 密码错误次数过多，账号被锁定，{countdown} 秒后解锁")
+                return LoginResult(LoginFailure.IPLOCK, retry_after=countdown)
             
             # 处理验证码
             if 'captcha' in response.text.lower():
@@ -408,34 +1747,50 @@ class EUserv:
 
                 max_captcha_retries = 10  # 验证码最多重试10次
                 for captcha_attempt in range(max_captcha_retries):
+                    submit_after = 0.0
                     if captcha_attempt > 0:
                         logger.warning(f"验证码识别失败，第 {captcha_attempt + 1}/{max_captcha_retries} 次重试...")
-                        time.sleep(3)  # 等待一下再重试
-
-                    # 识别验证码
-                    captcha_code = recognize_and_calculate(captcha_url, self.session)
+                        # 两次提交之间间隔 3 秒，下一张验证码的下载和识别在间隔内完成
+                        submit_after = time.monotonic() + 3
+                        captcha_response = None
+
+                    # 下载并识别验证码（下载走 HTTP 阶段，识别走 OCR 阶段）
+                    logger.info("正在处理验证码...")
+                    if captcha_response is None or captcha_response.status_code != 200:
+                        captcha_response = yield StageCall(STAGE_HTTP, self.session.get, captcha_url)
+                        round_trips += 1
+                    else:
+                        logger.debug("使用预取的验证码图片")
+                        round_trips_saved += 1
+                    captcha_code = yield StageCall(STAGE_OCR, solve_captcha, captcha_response.content)
                 
                     if not captcha_code:
                         logger.error("❌ 验证码识别失败")
-                        return False
+                        return LoginResult(LoginFailure.CAPTCHA)
                     
                     captcha_data = {
                         'subaction': 'login',
                         'sess_id': sess_id,
                         'captcha_code': captcha_code
                     }
+
+                    remaining = submit_after - time.monotonic()
+                    if remaining > 0:
+                        yield Wait(remaining)
                 
-                    response = self.session.post(url, headers=headers, data=captcha_data)
+                    response = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=captcha_data)
+                    round_trips += 1
                     response.raise_for_status()
                     
                     # 检查验证码是否正确
+                    save_captcha_sample(captcha_response.content, captcha_code, 'captcha' not in response.text.lower())
                     if 'captcha' in response.text.lower():
                         logger.warning(f"❌ 验证码错误（第 {captcha_attempt + 1} 次）")
                         if captcha_attempt < max_captcha_retries - 1:
                             continue  # 继续重试
                         else:
                             logger.error("❌ 验证码错误次数过多，重新进入登录流程")
-                            return False
+                            return LoginResult(LoginFailure.CAPTCHA)
                     else:
                         soup = BeautifulSoup(response.text, "html.parser")
                         logger.info("✅ 验证码验证成功")
@@ -446,17 +1801,14 @@ class EUserv:
             if 'PIN that you receive via email' in response.text:
                 self.c_id = soup.find("input", {"name": "c_id"})["value"]
                 logger.info("⚠️ 需要 PIN 验证")
-                time.sleep(3)  # 等待邮件到达
-                
-                pin = get_euserv_pin(
-                    self.config.email,
-                    self.config.email_password,
-                    self.config.imap_server
-                )
+                if not allow_pin:
+                    logger.warning(f"⚠️ 账号 {self.config.email} 登录需要 PIN 验证，只读模式下跳过")
+                    return LoginResult(LoginFailure.PIN_REQUIRED)
+                pin = yield Await(get_mail_hub().request_pin(self.config, since))
                 
                 if not pin:
                     logger.error("❌ 获取 PIN 码失败")
-                    return False
+                    return LoginResult(LoginFailure.PIN)
                 
                 
                 login_confirm_data = {
@@ -466,136 +1818,64 @@ class EUserv:
                     'subaction': 'login',
                     'c_id': self.c_id,
                 }
-                response = self.session.post(url, headers=headers, data=login_confirm_data)
+                response = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=login_confirm_data)
+                round_trips += 1
                 response.raise_for_status()
 
 
             # 检查登录成功
-            success_checks = [
-                'Hello' in response.text,
-                'Confirm or change your customer data here' in response.text,
-                'logout' in response.text.lower() and 'customer' in response.text.lower()
-            ]
-            
-            if any(success_checks):
+            if is_logged_in_page(response.text):
                 logger.info(f"✅ 账号 {self.config.email} 登录成功")
                 self.sess_id = sess_id
-                return True
+                self.landing_page = response.text
+                return LoginResult()
             else:
                 logger.error(f"❌ 账号 {self.config.email} 登录失败")
-                return False
+                return LoginResult(LoginFailure.UNKNOWN)
                 
         except Exception as e:
             logger.error(f"❌ 登录过程出现异常: {e}", exc_info=True)
-            return False
+            return LoginResult(LoginFailure.TRANSIENT)
+        finally:
+            self.login_round_trips += round_trips
+            self.login_round_trips_saved += round_trips_saved
+            logger.info(f"本次登录网络往返 {round_trips} 次，并行/预取节省 {round_trips_saved} 次")
     
 
 
     def update_info(self):
-        # 判断当前日期是否为2号或22号，一个月更新两次
-        current_day = datetime.now().day
-        if current_day not in [2, 22]:
+        """EUserv 要求确认客户资料时（登录落地页出现确认提示），原样提交客户资料完成确认"""
+        if not customer_data_pending(self.landing_page):
+            logger.debug("无需确认客户资料")
             return
 
         logger.info(f"更新用户信息...")
         try:
-            # 更新用户信息，euserv每隔一段时间就需要用户更新信息，每个月2号，22号
             #1.进入用户界面
             url = f"https://support.euserv.com/index.iphp?sess_id={self.sess_id}&action=show_customerdata"
-            showinfo_data = {
-                'sess_id': self.sess_id,
-                'action': 'show_customerdata'
-            }
             headers = {'user-agent': USER_AGENT, 
                        'host': 'support.euserv.com',
-                       'referer': 'https://support.euserv.com/index.iphp?sess_id={self.sess_id}&subaction=show_kwk_main'
+                       'referer': f'https://support.euserv.com/index.iphp?sess_id={self.sess_id}&subaction=show_kwk_main'
                        }
             
             logger.info(f"进入用户界面...")
             response = self.session.get(url=url, headers=headers)
             response.raise_for_status()
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-
+            #2.一次遍历读取全部 c_* 字段，页面新增字段时也能原样提交
+            upInfo_data = extract_customer_form(response.text)
+            if not upInfo_data:
+                logger.error("❌ 未找到客户资料表单，跳过更新用户信息")
+                return False
             if not self.c_id:
-                self.c_id = soup.find("input", {"name": "c_id"})["value"]
-            c_att = soup.select_one('#c_att option[selected]').get('value')
-            c_street = soup.find('input', {'name': 'c_street'})['value']
-            c_streetno = soup.find('input', {'name': 'c_streetno'})['value']
-            c_postal = soup.find('input', {'name': 'c_postal'})['value']
-            c_city = soup.find('input', {'name': 'c_city'})['value']
-            c_country = soup.select_one('#c_country option[selected]').get('value')
-            c_phone_country_prefix = soup.find('input', {'name': 'c_phone_country_prefix'})['value']      
-            c_phone_password = soup.find('input', {'name': 'c_phone_password'})['value'] 
-            c_fax_country_prefix = soup.find('input', {'name': 'c_fax_country_prefix'})['value'] 
-            c_tac_date = soup.find('input', {'name': 'c_tac_date'})['value'] 
-            c_website = soup.find('input', {'name': 'c_website'})['value'] 
-            c_firstcontact = soup.select_one('#c_firstcontact option[selected]').get('value')
-            c_emailabo_contract = soup.find('input', {'name': 'c_emailabo_contract'})['value'] 
-            c_emailabo_products = soup.find('input', {'name': 'c_emailabo_products'})['value'] 
-            c_forumnick = soup.find('input', {'name': 'c_forumnick'})['value'] 
-            c_hrno = soup.find('input', {'name': 'c_hrno'})['value'] 
-            c_hrcourt = soup.find('input', {'name': 'c_hrcourt'})['value'] 
-            c_taxid = soup.find('input', {'name': 'c_taxid'})['value'] 
-            c_identifier = soup.find('input', {'name': 'c_identifier'})['value'] 
-            c_birthplace = soup.find('input', {'name': 'c_birthplace'})['value'] 
-            c_country_of_birth = soup.select_one('#c_country_of_birth option[selected]').get('value')
-
-            c_birthdays = soup.find_all('input', {'name': 'c_birthday[]'})
-            c_birthday_value = []
-            for c_birthday in c_birthdays:
-                if c_birthday:
-                    c_birthday_value.append(c_birthday['value'].strip())
-                else:
-                    c_birthday_value.append('')
-
-            c_phones = soup.find_all('input', {'name': 'c_phone[]'})
-            c_phone_value = []
-            for c_phone in c_phones:
-                if c_phone:
-                    c_phone_value.append(c_phone['value'].strip())
-                else:
-                    c_phone_value.append('')
-
-            c_faxs = soup.find_all('input', {'name': 'c_fax[]'})
-            c_fax_value = []
-            for c_fax in c_faxs:
-                if c_fax:
-                    c_fax_value.append(c_fax['value'].strip())
-                else:
-                    c_fax_value.append('')     
-
-            upInfo_data = {
+                self.c_id = upInfo_data.get('c_id')
+            upInfo_data.setdefault('c_org', '')
+            upInfo_data.setdefault('c_ustid[]', ['', ''])
+            upInfo_data.update({
                 'sess_id': self.sess_id,
                 'subaction': 'kc2_customer_data_update',
-                'c_id': self.c_id,
-                'c_org': '',
-                'c_ustid[]': ['', ''],
-                'c_att': c_att,
-                'c_street': c_street,
-                'c_streetno': c_streetno,
-                'c_postal': c_postal,
-                'c_city': c_city,
-                'c_country': c_country,
-                'c_birthday[]': c_birthday_value,
-                'c_phone_country_prefix': c_phone_country_prefix,
-                'c_phone[]': c_phone_value,
-                'c_phone_password': c_phone_password,
-                'c_fax_country_prefix': c_fax_country_prefix,
-                'c_fax[]': c_fax_value,
-                'c_tac_date': c_tac_date,
-                'c_website': c_website,
-                'c_firstcontact': c_firstcontact,
-                'c_emailabo_contract': c_emailabo_contract,
-                'c_emailabo_products': c_emailabo_products,
-                'c_forumnick': c_forumnick,
-                'c_hrno': c_hrno,
-                'c_hrcourt': c_hrcourt,
-                'c_taxid': c_taxid,
-                'c_identifier': c_identifier,
-                'c_birthplace': c_birthplace,
-                'c_country_of_birth': c_country_of_birth
-            }
+                'c_id': self.c_id
+            })
 
             url = f"https://support.euserv.com/index.iphp"
             logger.info(f"提交保存用户信息...")
@@ -604,8 +1884,9 @@ class EUserv:
 
             if 'customer data has been changed' in response.text:
                 logger.info(f"保存用户信息成功")
+                self.landing_page = None
             else:
-                logger.info(f"保存用户信息失败，接口返回response={response.text}")
+                logger.info(f"保存用户信息失败，接口返回response={response.text[:500]}")
 
         except Exception as e:
             logger.error(f"❌ 更新用户信息异常: {e}", exc_info=True)
@@ -627,34 +1908,8 @@ class EUserv:
             detail_response = self.session.get(url=url, headers=headers)
             detail_response.raise_for_status()
 
-            soup = BeautifulSoup(detail_response.text, 'html.parser')
-            servers = {}
-
-            selector = '#kc2_order_customer_orders_tab_content_1 .kc2_order_table.kc2_content_table tr, #kc2_order_customer_orders_tab_content_2 .kc2_order_table.kc2_content_table tr'
-            for tr in soup.select(selector):
-                server_id = tr.select('.td-z1-sp1-kc')
-                if len(server_id) != 1:
-                    continue
-                
-                action_containers = tr.select('.td-z1-sp2-kc .kc2_order_action_container')
-                if not action_containers:
-                    continue
-                    
-                action_text = action_containers[0].get_text()
-                logger.debug(f"续期信息: {action_text}")
-
-                can_renew = action_text.find("Contract extension possible from") == -1
-                can_renew_date = ""
-                
-                if not can_renew:
-                    date_pattern = r'\b\d{4}-\d{2}-\d{2}\b'
-                    match = re.search(date_pattern, action_text)
-                    if match:
-                        can_renew_date = match.group(0)
-                        can_renew = datetime.today().date() >= datetime.strptime(can_renew_date, "%Y-%m-%d").date()
-
-                server_id_text = server_id[0].get_text().strip()
-                servers[server_id_text] = (can_renew, can_renew_date)
+            self.session_valid = is_logged_in_page(detail_response.text)
+            servers = parse_servers(detail_response.text)
             
             logger.info(f"✅ 账号 {self.config.email} 找到 {len(servers)} 台服务器")
             return servers
@@ -665,6 +1920,10 @@ class EUserv:
     
     def renew_server(self, order_id: str) -> bool:
         """续期服务器"""
+        return run_inline(self.renew_server_steps(order_id))
+
+    def renew_server_steps(self, order_id: str):
+        """续期流程步骤生成器，返回是否续期成功"""
         logger.info(f"正在续期服务器 {order_id}...")
         
         url = "https://support.euserv.com/index.iphp"
@@ -686,18 +1945,19 @@ class EUserv:
                 'show_contract_extension': '1',
                 'choose_order_subaction': 'show_contract_details'
             }
-            resp1 = self.session.post(url, headers=headers, data=data)
+            resp1 = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=data)
             resp1.raise_for_status()
             
             # 步骤2: 触发发送 PIN
             logger.debug("步骤2: 触发发送 PIN...")
+            since = datetime.now(timezone.utc)
             data = {
                 'sess_id': self.sess_id,
                 'subaction': 'show_kc2_security_password_dialog',
                 'prefix': 'kc2_customer_contract_details_extend_contract_',
                 'type': '1'
             }
-            resp2 = self.session.post(url, headers=headers, data=data)
+            resp2 = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=data)
             resp2.raise_for_status()
             # 检查PIN发送响应
             if resp2.status_code != 200:
@@ -706,12 +1966,7 @@ class EUserv:
             
             # 步骤3: 获取 PIN
             logger.debug("步骤3: 等待并获取 PIN 码...")
-            time.sleep(8)
-            pin = get_euserv_pin(
-                self.config.email,
-                self.config.email_password,
-                self.config.imap_server
-            )
+            pin = yield Await(get_mail_hub().request_pin(self.config, since))
             
             if not pin:
                 logger.error(f"❌ 获取续期 PIN 码失败")
@@ -728,7 +1983,7 @@ class EUserv:
                 'ident': 'kc2_customer_contract_details_extend_contract_' + order_id
             }
             
-            resp3 = self.session.post(url, headers=headers, data=data)
+            resp3 = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=data)
             resp3.raise_for_status()
 
             result = json.loads(resp3.text)
@@ -740,7 +1995,7 @@ class EUserv:
             
             token = result['token']['value']
             logger.debug(f"✅ 获取到 token: {token[:20]}...")
-            time.sleep(2)
+            yield Wait(2)
 
             # 步骤4.5: 弹出小窗
             logger.debug("步骤4.5: 确认续期图...")
@@ -749,7 +2004,7 @@ class EUserv:
                 'subaction': 'kc2_customer_contract_details_get_extend_contract_confirmation_dialog',
                 'token': token
             }
-            resp4 = self.session.post(url, headers=headers, data=data)
+            resp4 = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=data)
             resp4.raise_for_status()
 
 
@@ -762,7 +2017,7 @@ class EUserv:
                 'token': token
             }
       
-            resp5 = self.session.post(url, headers=headers, data=data)
+            resp5 = yield StageCall(STAGE_HTTP, self.session.post, url, headers=headers, data=data)
             resp5.raise_for_status()
             # with open('debug_resp5.html', 'w', encoding='utf-8') as f:
             #     f.write(resp5.text)
@@ -867,8 +2122,313 @@ def send_notification(title: str, message: str, config: GlobalConfig):
     send_bark(title, plain_message, config)
 
 
-def process_account(account_config: AccountConfig, global_config: GlobalConfig) -> Dict:
-    """处理单个账号的续期任务"""
+# ============== 紧急度调度 ==============
+def load_state() -> Dict:
+    """读取上次运行保存的状态文件"""
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"⚠️ 读取状态文件失败，按配置顺序处理: {e}")
+        return {}
+
+
+def save_state(state: Dict):
+    """保存状态文件（先写临时文件再替换，避免写入中断导致文件损坏）"""
+    try:
+        tmp_file = STATE_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, STATE_FILE)
+    except Exception as e:
+        logger.warning(f"⚠️ 保存状态文件失败: {e}")
+
+
+def load_sessions() -> Dict:
+    """读取缓存的登录会话"""
+    try:
+        with open(SESSION_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.warning(f"⚠️ 读取会话缓存失败: {e}")
+        return {}
+
+
+def save_session(euserv: 'EUserv'):
+    """缓存账号登录后的 sess_id 和 cookies，供只读的 status 命令复用，避免重复登录"""
+    with session_file_lock:
+        sessions = load_sessions()
+        sessions[euserv.config.email] = {
+            'sess_id': euserv.sess_id,
+            'cookies': [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                        for cookie in euserv.session.cookies],
+            'saved': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        try:
+            tmp_file = SESSION_FILE + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(sessions, f, ensure_ascii=False, indent=2)
+            os.chmod(tmp_file, 0o600)
+            os.replace(tmp_file, SESSION_FILE)
+        except Exception as e:
+            logger.warning(f"⚠️ 保存会话缓存失败: {e}")
+
+
+def state_key(email: str) -> str:
+    """状态文件中的账号键：邮箱的 SHA-256（状态文件会保存在 Actions 缓存中，不能出现明文邮箱）"""
+    return hashlib.sha256(email.lower().encode()).hexdigest()
+
+
+def order_urgency(can_renew: bool, can_renew_date: str) -> Tuple[int, str]:
+    """订单紧急度排序键：当前可续期的最先，其余按可续期日期升序"""
+    return (0 if can_renew else 1, can_renew_date or '')
+
+
+def account_urgency(account_config: AccountConfig, state: Dict) -> str:
+    """
+    账号紧急度：取已知订单中最早的可续期日期
+    没有历史记录或日期缺失的订单视为今天到期，优先处理
+    """
+    today = datetime.today().strftime('%Y-%m-%d')
+    orders = state.get('accounts', {}).get(state_key(account_config.email), {}).get('orders')
+    if not orders:
+        return today
+    return min((date or today) for date in orders.values())
+
+
+def schedule_accounts(accounts: List[AccountConfig], state: Dict) -> List[AccountConfig]:
+    """按紧急度对账号排序（日期相同时保持配置顺序）"""
+    return sorted(accounts, key=lambda account: account_urgency(account, state))
+
+
+def update_state(state: Dict, results: List[Dict]):
+    """用本次获取到的订单信息更新状态"""
+    accounts_state = state.setdefault('accounts', {})
+    for result in results:
+        servers = result.get('servers')
+        if not servers:
+            continue
+        accounts_state.pop(result['email'], None)  # 旧版本以明文邮箱为键的记录
+        accounts_state[state_key(result['email'])] = {
+            'orders': {order_id: can_renew_date for order_id, (_, can_renew_date) in servers.items()},
+            'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+def verify_renewals(old_servers: Dict[str, Tuple[bool, str]], new_servers: Dict[str, Tuple[bool, str]],
+                    renew_results: List[Dict], attempted: List[str]):
+    """
+    按续期后重新获取的订单列表校验续期结果（原地更新 renew_results）
+    订单不再可续期，或可续期日期晚于续期前，视为续期已生效
+    """
+    for renew_result in renew_results:
+        order_id = renew_result['order_id']
+        if order_id not in attempted:
+            continue
+        reported = renew_result['success']
+        if not new_servers:
+            renew_result['message'] += "（未能获取订单列表，结果未校验）"
+            continue
+        if order_id not in new_servers:
+            renew_result['success'] = False
+            renew_result['message'] = f"⚠️ 服务器 {order_id} 续期后未出现在订单列表中，请手动检查"
+            continue
+
+        _, old_date = old_servers.get(order_id, (True, ''))
+        new_can_renew, new_date = new_servers[order_id]
+        renewed = not new_can_renew or (bool(new_date) and new_date > old_date)
+        renew_result['success'] = renewed
+        if renewed:
+            next_date = f"，下次可续期日期 {new_date}" if new_date else ""
+            note = "" if reported else "（续期流程报错，但校验确认已生效）"
+            renew_result['message'] = f"✅ 服务器 {order_id} 续期成功{next_date}{note}"
+        elif reported:
+            renew_result['message'] = f"❌ 服务器 {order_id} 续期请求已提交，但可续期日期未变化，续期未生效"
+        else:
+            renew_result['message'] = f"❌ 服务器 {order_id} 续期失败"
+
+
+def budget_exhausted(deadline: Optional[float]) -> bool:
+    """是否已超出运行时间预算"""
+    return deadline is not None and time.monotonic() >= deadline
+
+
+# ============== 账号租约（多实例去重） ==============
+# GitHub Actions 和 systemd 定时器可能同时运行，处理账号前先获取租约，
+# 已被其他运行实例持有且未过期的账号直接跳过；持有期间由心跳线程定期续约。
+class LeaseBackend:
+    """租约存储后端接口，实现以下方法即可接入数据库、Redis 等共享存储，让不同机器上的运行实例互斥"""
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """租约空闲、已过期或已属于 owner 时获取（续约）成功"""
+        raise NotImplementedError
+
+    def renew(self, key: str, owner: str, ttl: float) -> bool:
+        """延长 owner 持有的租约，租约已不属于 owner 时返回 False"""
+        raise NotImplementedError
+
+    def release(self, key: str, owner: str):
+        """释放 owner 持有的租约"""
+        raise NotImplementedError
+
+
+class SqliteLeaseBackend(LeaseBackend):
+    """本机 SQLite 租约后端，适用于同一台机器上的多个运行实例（systemd 定时器、手动运行、Docker 挂载目录）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)')
+
+    def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            cursor = conn.execute(
+                'INSERT INTO leases (key, owner, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+                'WHERE leases.owner = excluded.owner OR leases.expires <= ?',
+                (key, owner, now + ttl, now)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, key: str, owner: str, ttl: float) -> bool:
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            cursor = conn.execute('UPDATE leases SET expires = ? WHERE key = ? AND owner = ?',
+                                  (time.time() + ttl, key, owner))
+            return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str):
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn, conn:
+            conn.execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, owner))
+
+
+class LeaseManager:
+    """
+    管理本运行实例持有的账号租约
+    租约有效期为 ttl 秒，心跳线程每 ttl/3 秒续约一次；续约失败（被其他实例接管）时标记为失效。
+    存储后端出错时按未启用租约处理，不阻止续期。
+    """
+
+    def __init__(self, backend: Optional[LeaseBackend], ttl: float = 300):
+        self.backend = backend
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = set()
+        self.unlocked = set()  # 存储后端出错、按未加锁继续处理的账号（视为持有，心跳不续约）
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def acquire(self, key: str) -> bool:
+        """获取账号租约，被其他运行实例持有时返回 False"""
+        if self.backend is None:
+            return True
+        try:
+            if not self.backend.acquire(key, self.owner, self.ttl):
+                return False
+        except Exception as e:
+            logger.warning(f"⚠️ 获取 {key} 的租约失败，按未加锁继续处理: {e}")
+            with self.lock:
+                self.unlocked.add(key)
+            return True
+        with self.lock:
+            self.held.add(key)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._heartbeat, name="lease_heartbeat", daemon=True)
+                self.thread.start()
+        return True
+
+    def is_held(self, key: str) -> bool:
+        """租约是否仍然有效（未启用租约时始终有效）"""
+        if self.backend is None:
+            return True
+        with self.lock:
+            return key in self.held or key in self.unlocked
+
+    def release(self, key: str):
+        with self.lock:
+            self.unlocked.discard(key)
+            if key not in self.held:
+                return
+            self.held.discard(key)
+        try:
+            self.backend.release(key, self.owner)
+        except Exception as e:
+            logger.warning(f"⚠️ 释放 {key} 的租约失败（将在 {self.ttl} 秒后自动过期）: {e}")
+
+    def close(self):
+        """停止心跳并释放所有租约"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            keys = list(self.held)
+        for key in keys:
+            self.release(key)
+
+    def _heartbeat(self):
+        while not self.stop_event.wait(self.ttl / 3):
+            with self.lock:
+                keys = list(self.held)
+            for key in keys:
+                try:
+                    renewed = self.backend.renew(key, self.owner, self.ttl)
+                except Exception as e:
+                    logger.warning(f"⚠️ {key} 的租约续约失败: {e}")
+                    continue
+                if not renewed:
+                    logger.warning(f"⚠️ {key} 的租约已失效，可能已被其他运行实例接管")
+                    with self.lock:
+                        self.held.discard(key)
+
+
+def create_lease_backend(spec: str) -> Optional[LeaseBackend]:
+    """
+    按 LEASE_BACKEND 创建租约后端
+    - 空：本机 SQLite（路径为 LEASE_DB）
+    - none：不使用租约
+    - 模块:工厂函数，如 my_leases:create_backend，工厂函数无参数，返回 LeaseBackend 实现（用于共享存储）
+    """
+    if not spec:
+        return SqliteLeaseBackend(LEASE_DB)
+    if spec.lower() == 'none':
+        return None
+    module_name, _, factory_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+_lease_manager = None
+_lease_manager_lock = threading.Lock()
+
+
+def get_lease_manager() -> LeaseManager:
+    """获取全局租约管理器（首次调用时按全局配置创建，后端创建失败时不使用租约）"""
+    global _lease_manager
+    with _lease_manager_lock:
+        if _lease_manager is None:
+            try:
+                backend = create_lease_backend(LEASE_BACKEND)
+            except Exception as e:
+                logger.warning(f"⚠️ 创建租约后端失败，本次运行不进行多实例去重: {e}")
+                backend = None
+            _lease_manager = LeaseManager(backend, GLOBAL_CONFIG.lease_ttl)
+        return _lease_manager
+
+
+def process_account(account_config: AccountConfig, global_config: GlobalConfig,
+                    deadline: Optional[float] = None) -> Dict:
+    """处理单个账号的续期任务（在独立的上下文中运行，日志账号标记不会残留到线程池的下一个任务）"""
+    return contextvars.copy_context().run(run_inline, process_account_steps(account_config, global_config, deadline))
+
+
+def process_account_steps(account_config: AccountConfig, global_config: GlobalConfig,
+                          deadline: Optional[float] = None):
+    """单个账号续期任务的步骤生成器，返回处理结果"""
+    log_account.set(account_config.email)
     result = {
         'email': account_config.email,
         'success': False,
@@ -876,30 +2436,57 @@ def process_account(account_config: AccountConfig, global_config: GlobalConfig)
         'renew_results': [],
         'error': None
     }
-    
+
+    if budget_exhausted(deadline):
+        logger.warning(f"⏱️ 已超出运行时间预算，跳过账号 {account_config.email}")
+        result['error'] = "超出运行时间预算，未处理"
+        return result
+
+    leases = get_lease_manager()
+    lease_key = account_config.email.lower()
+    if not leases.acquire(lease_key):
+        logger.warning(f"⏭️ 账号 {account_config.email} 正由其他运行实例处理，跳过")
+        result['error'] = "其他运行实例正在处理该账号，已跳过"
+        return result
+
     try:
         euserv = EUserv(account_config)
         
         # 登录（最多重试）
-        login_success = False
+        # 按失败原因决定是否重试：账号密码错误等致命原因立即停止，IP 锁定等待倒计时，PIN 超时稍等后重试，验证码/网络错误立即重试
+        enter_phase('login')
+        login_result = LoginResult(LoginFailure.UNKNOWN)
         for attempt in range(global_config.max_login_retries):
-            if attempt > 0:
-                logger.info(f"账号 {account_config.email} 第 {attempt + 1} 次登录尝试...")
-                time.sleep(5)
-            
-            if euserv.login():
-                login_success = True
+            login_result = yield from euserv.login_steps()
+            if login_result or attempt == global_config.max_login_retries - 1:
                 break
+
+            retry, delay = LOGIN_RETRY_POLICY[login_result.reason]
+            if delay is None:
+                delay = login_result.retry_after
+            if not retry:
+                logger.error(f"❌ 账号 {account_config.email} 登录失败（{LoginFailure.MESSAGES[login_result.reason]}），不再重试")
+                break
+            if budget_exhausted(deadline) or (deadline is not None and time.monotonic() + delay >= deadline):
+                logger.warning(f"⏱️ 运行时间预算不足，停止账号 {account_config.email} 的登录重试")
+                break
+            logger.info(f"账号 {account_config.email} {f'{delay:.0f} 秒后' if delay else '立即'}进行第 {attempt + 2} 次登录尝试...")
+            if delay:
+                yield Wait(delay)
         
-        if not login_success:
-            result['error'] = "登录失败"
+        if not login_result:
+            result['error'] = f"登录失败（{LoginFailure.MESSAGES[login_result.reason]}）"
             return result
+        save_session(euserv)
         
-        # 更新用户信息
-        euserv.update_info()
+        # 更新用户信息（仅在 EUserv 要求确认客户资料时）
+        if customer_data_pending(euserv.landing_page):
+            enter_phase('update_info')
+            yield StageCall(STAGE_HTTP, euserv.update_info)
 
         # 获取服务器列表
-        servers = euserv.get_servers()
+        enter_phase('get_servers')
+        servers = yield StageCall(STAGE_HTTP, euserv.get_servers)
         result['servers'] = servers
         
         if not servers:
@@ -907,12 +2494,29 @@ def process_account(account_config: AccountConfig, global_config: GlobalConfig)
             result['success'] = True  # 登录成功，只是没有服务器
             return result
         
-        # 检查并续期
-        for order_id, (can_renew, can_renew_date) in servers.items():
+        # 检查并续期（按紧急度排序，最先处理最可能过期的订单）
+        enter_phase('renew')
+        attempted = []
+        for order_id, (can_renew, can_renew_date) in sorted(servers.items(), key=lambda item: order_urgency(*item[1])):
             logger.info(f"检查服务器: {order_id}")
-            if can_renew:
+            if can_renew and budget_exhausted(deadline):
+                logger.warning(f"⏱️ 已超出运行时间预算，跳过服务器 {order_id} 的续期")
+                result['renew_results'].append({
+                    'order_id': order_id,
+                    'success': False,
+                    'message': f"⏱️ 服务器 {order_id} 超出运行时间预算，未续期"
+                })
+            elif can_renew and not leases.is_held(lease_key):
+                logger.warning(f"⚠️ 账号租约已失效，跳过服务器 {order_id} 的续期")
+                result['renew_results'].append({
+                    'order_id': order_id,
+                    'success': False,
+                    'message': f"⏭️ 服务器 {order_id} 的账号租约已失效（可能由其他运行实例处理），未续期"
+                })
+            elif can_renew:
                 logger.info(f"⏰ 服务器 {order_id} 可以续期")
-                if euserv.renew_server(order_id):
+                attempted.append(order_id)
+                if (yield from euserv.renew_server_steps(order_id)):
                     result['renew_results'].append({
                         'order_id': order_id,
                         'success': True,
@@ -926,62 +2530,117 @@ def process_account(account_config: AccountConfig, global_config: GlobalConfig)
                     })
             else:
                 logger.info(f"✓ 服务器 {order_id} 暂不需要续期（可续期日期: {can_renew_date}）")
+
+        # 全部续期完成后重新获取一次订单列表，按可续期日期的变化校验每个订单的实际结果
+        if attempted:
+            logger.info(f"校验账号 {account_config.email} 的 {len(attempted)} 个续期结果...")
+            enter_phase('verify')
+            new_servers = yield StageCall(STAGE_HTTP, euserv.get_servers)
+            verify_renewals(servers, new_servers, result['renew_results'], attempted)
+            if new_servers:
+                result['servers'] = new_servers
         
         result['success'] = True
         
     except Exception as e:
         logger.error(f"处理账号 {account_config.email} 时发生异常: {e}", exc_info=True)
         result['error'] = str(e)
+    finally:
+        enter_phase(None)
+        leases.release(lease_key)
     
     return result
 
 
-def main():
-    """主函数"""
-    logger.info("=" * 60)
-    logger.info("EUserv 多账号自动续期脚本（多线程版本）")
-    logger.info(f"执行时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    logger.info(f"配置账号数: {len(ACCOUNTS)}")
-    logger.info(f"最大并发线程: {GLOBAL_CONFIG.max_workers}")
-    logger.info("=" * 60)
-    
+def status_account(account_config: AccountConfig, cached_session: Optional[Dict], allow_login: bool = False) -> Dict:
+    """
+    只读获取单个账号的订单状态：只使用缓存会话，会话失效时报告"会话已过期"。
+    allow_login 为 True 时重新登录（需要 PIN 时跳过）；注意 EUserv 在登录到达 PIN 页面时就会发送 PIN 邮件，
+    重新登录还会消耗验证码尝试次数并可能触发 IP 锁定。
+    """
+    log_account.set(account_config.email)
+    enter_phase('status')
+    result = {'email': account_config.email, 'servers': {}, 'error': None}
+    try:
+        euserv = EUserv(account_config)
+        if cached_session:
+            euserv.restore_session(cached_session)
+            servers = euserv.get_servers()
+            if euserv.session_valid:
+                result['servers'] = servers
+                return result
+            logger.info(f"账号 {account_config.email} 的缓存会话已失效")
+        if not allow_login:
+            result['error'] = "会话已过期（或没有缓存会话），可使用 --login 重新登录"
+            return result
+
+        login_result = euserv.login(allow_pin=False)
+        if not login_result:
+            if login_result.reason == LoginFailure.PIN_REQUIRED:
+                result['error'] = "登录需要 PIN 验证，已跳过"
+            else:
+                result['error'] = f"登录失败（{LoginFailure.MESSAGES[login_result.reason]}）"
+            return result
+        save_session(euserv)
+        result['servers'] = euserv.get_servers()
+    except Exception as e:
+        logger.error(f"获取账号 {account_config.email} 状态时发生异常: {e}", exc_info=True)
+        result['error'] = str(e)
+    finally:
+        enter_phase(None)
+    return result
+
+
+def status(output_json: bool = False, allow_login: bool = False):
+    """只读状态命令：并行获取所有账号的订单及可续期日期，不更新资料、不续期、不读取 PIN 邮件；默认只使用缓存会话"""
     if not ACCOUNTS:
         logger.error("❌ 未配置任何账号")
         sys.exit(1)
-    
-    # 使用线程池处理多个账号
-    all_results = []
-    with ThreadPoolExecutor(max_workers=GLOBAL_CONFIG.max_workers) as executor:
-        # 提交所有任务
-        future_to_account = {
-            executor.submit(process_account, account, GLOBAL_CONFIG): account 
-            for account in ACCOUNTS
-        }
-        
-        # 等待任务完成
-        for future in as_completed(future_to_account):
-            account = future_to_account[future]
-            try:
-                result = future.result()
-                all_results.append(result)
-            except Exception as e:
-                logger.error(f"处理账号 {account.email} 时发生未预期的异常: {e}", exc_info=True)
-                all_results.append({
-                    'email': account.email,
-                    'success': False,
-                    'error': f"未预期的异常: {str(e)}"
-                })
-    
-    # 生成汇总报告
+
+    sessions = load_sessions()
+    with ThreadPoolExecutor(max_workers=min(32, len(ACCOUNTS))) as executor:
+        results = list(executor.map(
+            lambda account: contextvars.copy_context().run(status_account, account, sessions.get(account.email),
+                                                           allow_login),
+            ACCOUNTS
+        ))
+
+    state = load_state()
+    update_state(state, results)
+    save_state(state)
+
+    orders = sorted(
+        ({'email': result['email'], 'order_id': order_id, 'can_renew': can_renew, 'can_renew_date': can_renew_date}
+         for result in results for order_id, (can_renew, can_renew_date) in result['servers'].items()),
+        key=lambda order: order_urgency(order['can_renew'], order['can_renew_date']) + (order['email'], order['order_id'])
+    )
+    errors = [{'email': result['email'], 'error': result['error']} for result in results if result['error']]
+
+    if output_json:
+        print(json.dumps({'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'orders': orders, 'errors': errors},
+                         ensure_ascii=False, indent=2))
+        return
+
+    email_width = max([len('账号')] + [len(order['email']) for order in orders])
+    print(f"{'账号':<{email_width}}  {'订单号':<12}  {'可续期':<6}  可续期日期")
+    for order in orders:
+        print(f"{order['email']:<{email_width}}  {order['order_id']:<12}  {'是' if order['can_renew'] else '否':<6}  "
+              f"{order['can_renew_date'] or '-'}")
+    for error in errors:
+        print(f"❌ {error['email']}: {error['error']}")
+
+
+def build_report(results: List[Dict]) -> str:
+    """输出汇总日志并生成通知消息"""
     logger.info("\n" + "=" * 60)
     logger.info("处理结果汇总")
     logger.info("=" * 60)
     
     message_parts = [f"<b>🔄 EUserv 多账号续期报告</b>\n"]
     message_parts.append(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    message_parts.append(f"处理账号数: {len(all_results)}\n")
+    message_parts.append(f"处理账号数: {len(results)}\n")
     
-    for result in all_results:
+    for result in results:
         email = result['email']
         logger.info(f"\n账号: {email}")
         message_parts.append(f"\n<b>📧 账号: {email}</b>")
@@ -1008,16 +2667,107 @@ def main():
                 if can_renew_date:
                     message_parts.append(f"    订单 {order_id}: 可续期日期 {can_renew_date}")
     
+    return "\n".join(message_parts)
+
+
+def main():
+    """主函数"""
+    logger.info("=" * 60)
+    logger.info("EUserv 多账号自动续期脚本（多线程版本）")
+    logger.info(f"执行时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info(f"配置账号数: {len(ACCOUNTS)}")
+    if GLOBAL_CONFIG.pipeline:
+        logger.info(f"流水线模式: 各阶段线程 {GLOBAL_CONFIG.stage_workers}，同时处理账号数 {GLOBAL_CONFIG.max_in_flight}")
+    else:
+        logger.info(f"最大并发线程: {GLOBAL_CONFIG.max_workers}")
+    if GLOBAL_CONFIG.run_time_budget:
+        logger.info(f"运行时间预算: {GLOBAL_CONFIG.run_time_budget} 秒")
+    logger.info("=" * 60)
+    
+    if not ACCOUNTS:
+        logger.error("❌ 未配置任何账号")
+        sys.exit(1)
+
+    deadline = time.monotonic() + GLOBAL_CONFIG.run_time_budget if GLOBAL_CONFIG.run_time_budget else None
+
+    # 流水线模式：HTTP / OCR / 邮件各阶段独立线程池；否则每个账号占用一个线程
+    if GLOBAL_CONFIG.pipeline:
+        executor = StagedPipeline(GLOBAL_CONFIG.stage_workers, GLOBAL_CONFIG.max_in_flight)
+        task = process_account_steps
+    else:
+        executor = ThreadPoolExecutor(max_workers=GLOBAL_CONFIG.max_workers)
+        task = process_account
+
+    # 按紧急度排序：线程池按提交顺序取任务，最可能过期的账号最先开始
+    state = load_state()
+    scheduled_accounts = schedule_accounts(ACCOUNTS, state)
+    
+    # 使用线程池处理多个账号
+    all_results = []
+    with executor:
+        # 提交所有任务
+        future_to_account = {
+            executor.submit(task, account, GLOBAL_CONFIG, deadline): account 
+            for account in scheduled_accounts
+        }
+        
+        # 等待任务完成
+        for future in as_completed(future_to_account):
+            account = future_to_account[future]
+            try:
+                result = future.result()
+                all_results.append(result)
+            except Exception as e:
+                logger.error(f"处理账号 {account.email} 时发生未预期的异常: {e}", exc_info=True)
+                all_results.append({
+                    'email': account.email,
+                    'success': False,
+                    'error': f"未预期的异常: {str(e)}"
+                })
+    get_mail_hub().close()
+    get_lease_manager().close()
+    
+    update_state(state, all_results)
+    save_state(state)
+
+    # 生成汇总报告
+    message = build_report(all_results)
+
     # 发送 Telegram 通知
-    message = "\n".join(message_parts)
     # send_telegram(message, GLOBAL_CONFIG)
     send_notification("EUserv 续期报告", message, GLOBAL_CONFIG)
     
     logger.info("\n" + "=" * 60)
     logger.info("执行完成")
     logger.info("=" * 60)
+    stop_profiler()
+    log_listener.stop()  # os._exit 不会执行 atexit，先把队列中的日志写完
     os._exit(0)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="EUserv 多账号自动续期")
+    parser.add_argument('command', nargs='?', default='renew', choices=['renew', 'status', 'captcha-server'],
+                        help="renew：登录并续期（默认）；status：只读查看所有账号的订单和可续期日期；"
+                             "captcha-server：启动常驻的验证码识别服务")
+    parser.add_argument('--json', action='store_true', help="status 命令以 JSON 格式输出")
+    parser.add_argument('--login', action='store_true',
+                        help="status 命令在缓存会话过期时重新登录（到达 PIN 页面时 EUserv 会发送 PIN 邮件）")
+    parser.add_argument('--listen', default=CAPTCHA_SERVICE or 'unix:/tmp/euserv_captcha.sock',
+                        help="captcha-server 的监听地址：unix:/path/to.sock 或 host:port（默认取 CAPTCHA_SERVICE）")
+    parser.add_argument('--profile', nargs='?', const='profiles', metavar='DIR',
+                        help="按阶段进行性能分析（cProfile + tracemalloc），结果写入 DIR/<时间>/（默认 profiles）")
+    args = parser.parse_args()
+    if args.profile:
+        start_profiler(args.profile)
+    if args.command == 'status':
+        status(output_json=args.json, allow_login=args.login)
+        stop_profiler()
+    elif args.command == 'captcha-server':
+        try:
+            parse_service_address(args.listen)
+        except ValueError as e:
+            parser.error(str(e))
+        serve_captcha(args.listen)
+    else:
+        main()
\ No newline at end of file
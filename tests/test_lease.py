@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import euser_renew  # noqa: E402
+
+
+class FailingBackend(euser_renew.LeaseBackend):
+    """存储不可用（被锁定或无法连接）的租约后端"""
+
+    def acquire(self, key, owner, ttl):
+        raise OSError("database is locked")
+
+    def renew(self, key, owner, ttl):
+        raise OSError("database is locked")
+
+    def release(self, key, owner):
+        raise OSError("database is locked")
+
+
+class LeaseManagerFailOpenTest(unittest.TestCase):
+    def test_backend_error_keeps_account_held(self):
+        leases = euser_renew.LeaseManager(FailingBackend(), ttl=300)
+        self.assertTrue(leases.acquire('a@example.com'))
+        self.assertTrue(leases.is_held('a@example.com'))
+        self.assertIsNone(leases.thread)  # 未加锁的账号不需要心跳续约
+
+        leases.release('a@example.com')
+        self.assertFalse(leases.is_held('a@example.com'))
+        leases.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+EUserv 专用验证码模型训练/导出脚本
+
+1. 运行主脚本时设置 CAPTCHA_SAMPLE_DIR=/path/to/samples 收集验证码样本（图片 + index.jsonl）
+2. 训练并导出 ddddocr 自定义模型格式（ONNX + 字符集 JSON），可选 int8 动态量化：
+   python tools/train_captcha_model.py --samples /path/to/samples --output models/euserv_captcha --quantize
+3. 运行主脚本时设置 OCR_MODEL_PATH=models/euserv_captcha.onnx（或 .int8.onnx）启用
+
+样本标签来源：
+- index.jsonl 中手工填写的 label 字段优先
+- 通过验证的字母数字验证码直接使用提交的答案
+- 通过验证的运算验证码用默认模型重新识别，按纠正表和已知答案反推出算式（如 3+5）
+未通过验证且没有手工标签的样本会被跳过；推导出的标签写入 labels.jsonl，供基准测试使用。
+
+依赖：torch（仅训练时需要）、onnx、onnxruntime
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import euser_renew  # noqa: E402
+
+IMAGE_HEIGHT = 64
+LABEL_OPERATORS = {'+': '+', '-': '-', '×': 'x', '/': '/'}  # 计算用运算符 → 标签中的运算符
+
+
+def derive_expression(raw_text: str, answer: str) -> str:
+    """根据默认模型的识别文本和已通过验证的答案反推运算式，无法唯一确定时返回空字符串"""
+    raw_text = raw_text.replace(' ', '')
+    for i in range(1, len(raw_text) - 1):
+        left = ''.join(euser_renew.DIGIT_CORRECTIONS.get(c, c) for c in raw_text[:i])
+        right = ''.join(euser_renew.DIGIT_CORRECTIONS.get(c, c) for c in raw_text[i + 1:])
+        if not (left.isdigit() and right.isdigit()):
+            continue
+        read_op = euser_renew.OPERATOR_CORRECTIONS.get(raw_text[i], raw_text[i])
+        matches = [op for op in LABEL_OPERATORS
+                   if euser_renew.calculate_operation(int(left), op, int(right), raw_text, silent=True) == answer]
+        if read_op in matches:
+            return f"{left}{LABEL_OPERATORS[read_op]}{right}"
+        if len(matches) == 1:
+            return f"{left}{LABEL_OPERATORS[matches[0]]}{right}"
+    return ''
+
+
+def load_samples(sample_dir: str):
+    """读取样本并推导标签，返回 [(预处理后的 PNG 字节, 标签)]"""
+    samples = []
+    labels = []
+    with open(os.path.join(sample_dir, 'index.jsonl'), 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    for record in records:
+        with open(os.path.join(sample_dir, record['file']), 'rb') as f:
+            processed = euser_renew.preprocess_captcha(f.read())
+
+        label = record.get('label', '')
+        if not label and record.get('accepted') and record.get('answer'):
+            answer = record['answer']
+            if len(answer) >= 6:
+                label = answer
+            else:
+                raw_text = euser_renew.get_ocr().classification(processed, png_fix=True).strip()
+                label = derive_expression(raw_text, answer)
+        if label:
+            samples.append((processed, label))
+            labels.append({'file': record['file'], 'label': label})
+
+    with open(os.path.join(sample_dir, 'labels.jsonl'), 'w', encoding='utf-8') as f:
+        for item in labels:
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+    print(f"样本 {len(records)} 个，可用于训练 {len(samples)} 个")
+    return samples
+
+
+def to_array(processed: bytes) -> np.ndarray:
+    """与 ddddocr 自定义模型（单通道、按高 64 等比缩放）一致的预处理"""
+    image = Image.open(io.BytesIO(processed))
+    image = image.resize((int(image.size[0] * (IMAGE_HEIGHT / image.size[1])), IMAGE_HEIGHT), Image.ANTIALIAS)
+    array = np.array(image.convert('L')).astype(np.float32) / 255.
+    return ((array - 0.456) / 0.224)[None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练并导出 EUserv 专用验证码模型")
+    parser.add_argument('--samples', required=True, help="CAPTCHA_SAMPLE_DIR 样本目录")
+    parser.add_argument('--output', default='models/euserv_captcha', help="输出路径（不含扩展名）")
+    parser.add_argument('--epochs', type=int, default=80)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--quantize', action='store_true', help="同时导出 int8 动态量化模型")
+    args = parser.parse_args()
+
+    import torch
+    from torch import nn
+
+    samples = load_samples(args.samples)
+    if len(samples) < 10:
+        print("可用样本太少，请先收集更多验证码样本")
+        sys.exit(1)
+
+    # 字符集：下标 0 为 CTC 空白符，与 ddddocr 约定一致
+    charset = [''] + sorted({char for _, label in samples for char in label})
+    char_index = {char: i for i, char in enumerate(charset)}
+
+    # 预处理只做一次
+    samples = [(to_array(processed), label) for processed, label in samples]
+    random.Random(0).shuffle(samples)
+    split = max(1, len(samples) // 10)
+    valid_samples, train_samples = samples[:split], samples[split:]
+
+    def make_batch(items, augment=False):
+        arrays = [array for array, _ in items]
+        if augment:
+            # 随机水平平移几个像素，缓解样本少时的过拟合
+            arrays = [np.roll(array, random.randint(-6, 6), axis=2) for array in arrays]
+        width = max(array.shape[2] for array in arrays)
+        batch = np.full((len(arrays), 1, IMAGE_HEIGHT, width), (1 - 0.456) / 0.224, dtype=np.float32)
+        for i, array in enumerate(arrays):
+            batch[i, :, :, :array.shape[2]] = array
+        targets = [char_index[char] for _, label in items for char in label]
+        target_lengths = [len(label) for _, label in items]
+        return torch.from_numpy(batch), torch.tensor(targets), torch.tensor(target_lengths)
+
+    def conv_block(in_channels, out_channels, pool):
+        return [nn.Conv2d(in_channels, out_channels, 3, padding=1), nn.BatchNorm2d(out_channels),
+                nn.ReLU(inplace=True), nn.MaxPool2d(pool)]
+
+    class CaptchaNet(nn.Module):
+        """轻量 CRNN：CNN 把高度压缩到 1、宽度缩小 8 倍作为序列，再经双向 GRU，CTC 训练"""
+
+        def __init__(self, num_classes):
+            super().__init__()
+            self.features = nn.Sequential(
+                *conv_block(1, 32, (2, 2)),     # 64 → 32
+                *conv_block(32, 64, (2, 2)),    # 32 → 16
+                *conv_block(64, 96, (2, 2)),    # 16 → 8
+                *conv_block(96, 128, (2, 1)),   # 8 → 4
+                nn.Conv2d(128, 128, (4, 1)), nn.ReLU(inplace=True),  # 4 → 1
+            )
+            self.rnn = nn.GRU(128, 64, bidirectional=True, batch_first=True)
+            self.classifier = nn.Linear(128, num_classes)
+
+        def forward(self, x):
+            features = self.features(x).squeeze(2).permute(0, 2, 1)  # (N, T, 128)
+            return self.classifier(self.rnn(features)[0])  # (N, T, 字符集)
+
+    class ExportWrapper(nn.Module):
+        """导出时直接输出 argmax 下标，符合 ddddocr 自定义模型的输出约定"""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, x):
+            return self.model(x).argmax(dim=2)
+
+    def decode(indexes):
+        chars, last_item = [], 0
+        for item in indexes:
+            if item != last_item and item != 0:
+                chars.append(charset[item])
+            last_item = item
+        return ''.join(chars)
+
+    model = CaptchaNet(len(charset))
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+    steps_per_epoch = (len(train_samples) + args.batch_size - 1) // args.batch_size
+    scheduler = torch.optim.lr_scheduler.OneCycleLR(optimizer, max_lr=args.lr, epochs=args.epochs,
+                                                    steps_per_epoch=steps_per_epoch)
+    ctc_loss = nn.CTCLoss(blank=0, zero_infinity=True)
+
+    for epoch in range(args.epochs):
+        model.train()
+        random.shuffle(train_samples)
+        total_loss = 0.0
+        for start in range(0, len(train_samples), args.batch_size):
+            images, targets, target_lengths = make_batch(train_samples[start:start + args.batch_size], augment=True)
+            log_probs = model(images).log_softmax(2).permute(1, 0, 2)  # (T, N, 字符集)
+            input_lengths = torch.full((images.shape[0],), log_probs.shape[0], dtype=torch.long)
+            loss = ctc_loss(log_probs, targets, input_lengths, target_lengths)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            total_loss += loss.item() * images.shape[0]
+
+        model.eval()
+        with torch.no_grad():
+            images, _, _ = make_batch(valid_samples)
+            predictions = model(images).argmax(dim=2).tolist()
+        correct = sum(decode(pred) == label for pred, (_, label) in zip(predictions, valid_samples))
+        print(f"epoch {epoch + 1}/{args.epochs} loss={total_loss / len(train_samples):.4f} "
+              f"验证集准确率={correct / len(valid_samples):.2%}")
+
+    # 导出 ONNX（输入名 input1，batch 和宽度均为动态）
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model_path = args.output + '.onnx'
+    dummy = torch.zeros(1, 1, IMAGE_HEIGHT, 200)
+    torch.onnx.export(ExportWrapper(model.eval()), dummy, model_path, input_names=['input1'], output_names=['output'],
+                      dynamic_axes={'input1': {0: 'batch', 3: 'width'}, 'output': {0: 'batch', 1: 'seq'}},
+                      opset_version=13, dynamo=False)
+    charsets = {'charset': charset, 'word': False, 'image': [-1, IMAGE_HEIGHT], 'channel': 1}
+    with open(args.output + '.json', 'w', encoding='utf-8') as f:
+        json.dump(charsets, f, ensure_ascii=False)
+    print(f"已导出: {model_path} ({os.path.getsize(model_path) / 1024:.0f} KB)")
+
+    if args.quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantized_path = args.output + '.int8.onnx'
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        with open(args.output + '.int8.json', 'w', encoding='utf-8') as f:
+            json.dump(charsets, f, ensure_ascii=False)
+        print(f"已导出: {quantized_path} ({os.path.getsize(quantized_path) / 1024:.0f} KB)")
+
+
+if __name__ == '__main__':
+    main()